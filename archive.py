@@ -0,0 +1,83 @@
+import struct
+import sys
+import zlib
+from array import array
+
+from tools import to_epoch_day, from_epoch_day
+
+_HEADER = struct.Struct('<BI')
+_VERSION = 2
+
+
+def _packed(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpacked(typecode, raw):
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+_WEIGHT_NULL = 1
+_SETS_NULL = 2
+_REPS_NULL = 4
+
+
+def pack_logs(logs):
+    """
+    Упаковывает записи прогресса в сжатый блоб из колоночных массивов.
+    Повторения хранятся как массив длин и склеенные строки, пустые значения - битовыми флагами.
+    :param logs: Список кортежей (вес, подходы, повторения, дата 'YYYY-MM-DD'), отсортированный по дате
+    :return: bytes
+    """
+    weights = array('d', (float(log[0] or 0) for log in logs))
+    sets = array('i', (int(log[1] or 0) for log in logs))
+    days = array('i', (to_epoch_day(log[3]) for log in logs))
+    flags = array('B', (
+        (_WEIGHT_NULL if log[0] is None else 0) | (_SETS_NULL if log[1] is None else 0) | (_REPS_NULL if log[2] is None else 0)
+        for log in logs))
+    reps = [str(log[2]).encode('utf-8') if log[2] is not None else b'' for log in logs]
+    lengths = array('I', (len(value) for value in reps))
+    body = (_HEADER.pack(_VERSION, len(logs)) + _packed(days) + _packed(weights) + _packed(sets)
+            + flags.tobytes() + _packed(lengths) + b''.join(reps))
+    return zlib.compress(body, 9)
+
+
+def unpack_logs(payload):
+    """
+    Распаковывает блоб, созданный pack_logs.
+    :return: Список кортежей (вес, подходы, повторения, дата 'YYYY-MM-DD') в порядке возрастания даты
+    """
+    body = zlib.decompress(payload)
+    version, count = _HEADER.unpack_from(body)
+    offset = _HEADER.size
+    days = _unpacked('i', body[offset:offset + 4 * count])
+    offset += 4 * count
+    weights = _unpacked('d', body[offset:offset + 8 * count])
+    offset += 8 * count
+    sets = _unpacked('i', body[offset:offset + 4 * count])
+    offset += 4 * count
+    if version == 1:
+        # Первая версия: повторения через '\n', пустые вес и подходы сохранены как 0
+        reps = body[offset:].decode('utf-8').split('\n') if count else []
+        return [(weights[i], sets[i], reps[i], from_epoch_day(days[i])) for i in range(count)]
+
+    flags = array('B', body[offset:offset + count])
+    offset += count
+    lengths = _unpacked('I', body[offset:offset + 4 * count])
+    offset += 4 * count
+    logs = []
+    for i in range(count):
+        end = offset + lengths[i]
+        logs.append((
+            None if flags[i] & _WEIGHT_NULL else weights[i],
+            None if flags[i] & _SETS_NULL else sets[i],
+            None if flags[i] & _REPS_NULL else body[offset:end].decode('utf-8'),
+            from_epoch_day(days[i])))
+        offset = end
+    return logs
@@ -0,0 +1,104 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import slow_queries
+from tools import encode_reps, encode_weight
+
+
+def populate(users, exercises, days):
+    today = int(time.time() // 86400)
+    reps, reps_max, reps_text = encode_reps("10")
+    rows = (
+        (user_id, exercise_id, today - day, encode_weight(40 + (day % 30)), 3, reps, reps_max, reps_text)
+        for user_id in range(1, users + 1)
+        for exercise_id in range(1, exercises + 1)
+        for day in range(0, days, 2)
+    )
+    with sqlite3.connect(database.DB_NAME) as conn:
+        conn.executemany("INSERT INTO users (user_id) VALUES (?)", ((u,) for u in range(1, users + 1)))
+        conn.executemany(
+            "INSERT INTO progress_logs (user_id, exercise_id, log_day, weight_x100, sets, reps, reps_max, reps_text) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def sizes():
+    # База в режиме WAL, а соединения пула открыты: без контрольной точки свежие страницы лежат в -wal,
+    # и размер основного файла ничего не говорит
+    with database._writer() as conn:
+        busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if busy:
+        raise RuntimeError("Контрольная точка WAL не завершилась, размеры были бы неверными")
+    with sqlite3.connect(database.DB_NAME) as conn:
+        stat = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    wal = database.DB_NAME + '-wal'
+    return {
+        'file_kb': os.path.getsize(database.DB_NAME) // 1024,
+        'wal_kb': (os.path.getsize(wal) if os.path.exists(wal) else 0) // 1024,
+        'progress_logs_kb': stat.get('progress_logs', 0) // 1024,
+        'hot_index_kb': stat.get('idx_progress_logs_user_exercise_day', 0) // 1024,
+        'archive_kb': stat.get('progress_archive', 0) // 1024,
+    }
+
+
+def time_queries(users, exercises, period, samples):
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(samples):
+        database.get_progress_logs(rng.randint(1, users), rng.randint(1, exercises), period)
+    return (time.perf_counter() - started) / samples * 1e6
+
+
+def time_range_scans(users, exercises, days, samples, cache_kb=2048):
+    rng = random.Random(2)
+    query = ("SELECT weight_x100, sets, reps, reps_max, reps_text, log_day FROM progress_logs "
+             "WHERE user_id = ? AND exercise_id = ? AND log_day >= ? ORDER BY log_day DESC")
+    today = int(time.time() // 86400)
+    conn = sqlite3.connect(database.DB_NAME)
+    conn.execute(f"PRAGMA cache_size = -{cache_kb}")
+    started = time.perf_counter()
+    for _ in range(samples):
+        conn.execute(query, (rng.randint(1, users), rng.randint(1, exercises), today - days)).fetchall()
+    conn.close()
+    return (time.perf_counter() - started) / samples * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк архивации progress_logs")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--exercises', type=int, default=5)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--horizon', type=int, default=90)
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+
+    slow_queries.SLOW_QUERY_THRESHOLD_MS = None
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_schema()
+        populate(args.users, args.exercises, args.days)
+
+        def report(label):
+            print(label, sizes())
+            for period in ('week', 'month', 'all'):
+                print(f"  get_progress_logs({period}): {time_queries(args.users, args.exercises, period, args.samples):.1f} us/query")
+            for days in (7, 30):
+                print(f"  скан {days} дней, кэш 2 МБ: {time_range_scans(args.users, args.exercises, days, args.samples * 10):.1f} us/query")
+
+        report("до архивации:")
+        started = time.perf_counter()
+        moved = database.archive_progress_logs(args.horizon)
+        reclaimed = database.reclaim_free_pages()
+        print(f"архивировано {moved} записей, освобождено {reclaimed} страниц за {time.perf_counter() - started:.1f} с")
+        report("после архивации:")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import digest
+import slow_queries
+from tools import to_epoch_day
+
+
+def populate(users, exercises, sessions, week_start):
+    week_day = to_epoch_day(week_start)
+    days = [week_day - 7 + 2 * i for i in range(sessions)] + [week_day + 2 * i for i in range(sessions)]
+    rows = (
+        (user_id, exercise_id, (40 + (user_id + day_index) % 30) * 100, 3, 10, day)
+        for user_id in range(1, users + 1)
+        for exercise_id in range(1, exercises + 1)
+        for day_index, day in enumerate(days)
+    )
+    with sqlite3.connect(database.DB_NAME) as conn:
+        conn.executemany(
+            "INSERT INTO progress_logs (user_id, exercise_id, weight_x100, sets, reps, log_day) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(week_start, stop_after=None):
+    delivered = []
+    stop = asyncio.Event()
+
+    async def deliver(user_id, text):
+        delivered.append(user_id)
+        if stop_after is not None and len(delivered) >= stop_after:
+            stop.set()
+
+    task = asyncio.create_task(digest.send_weekly_digest(deliver, week_start))
+    if stop_after is not None:
+        await stop.wait()
+        task.cancel()
+    try:
+        stats = await task
+    except asyncio.CancelledError:
+        stats = None
+    return delivered, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк недельной сводки")
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--exercises', type=int, default=2)
+    parser.add_argument('--sessions', type=int, default=3, help="тренировок в неделю")
+    args = parser.parse_args()
+
+    slow_queries.SLOW_QUERY_THRESHOLD_MS = None
+    today = datetime.now(timezone.utc).date()
+    week_start = today - timedelta(days=today.weekday() + 7)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_schema()
+        started = time.perf_counter()
+        populate(args.users, args.exercises, args.sessions, week_start)
+        built = database.backfill_personal_records()
+        rows = args.users * args.exercises * args.sessions * 2
+        print(f"подготовка: {rows} записей, {built} рекордов за {time.perf_counter() - started:.1f} с")
+
+        rss_before = max_rss_mb()
+        started = time.perf_counter()
+        delivered, stats = asyncio.run(run(week_start))
+        elapsed = time.perf_counter() - started
+        print(f"сводка: {stats['sent']} пользователей за {elapsed:.1f} с "
+              f"({stats['sent'] / elapsed:.0f} польз./с, {rows / elapsed:.0f} записей/с), "
+              f"прирост max RSS {max_rss_mb() - rss_before:.1f} МБ")
+
+        database.set_job_checkpoint(digest.CHECKPOINT_NAME, None)
+        stop_after = args.users // 3
+        first, _ = asyncio.run(run(week_start, stop_after=stop_after))
+        second, stats = asyncio.run(run(week_start))
+        repeated = len(first) + len(second) - args.users
+        print(f"возобновление: прервано после {len(first)}, дослано {len(second)}, "
+              f"повторно отправлено {repeated} (не больше пачки {digest.DIGEST_BATCH_USERS})")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import slow_queries
+
+LEGACY_SCHEMA = """
+    PRAGMA auto_vacuum = INCREMENTAL;
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY, weight REAL, height INTEGER, age INTEGER,
+        gender TEXT, target TEXT, activity_level TEXT
+    );
+    CREATE TABLE exercises (
+        exercise_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE,
+        muscle_group TEXT NOT NULL, default_sets INTEGER, default_reps TEXT
+    );
+    CREATE TABLE progress_logs (
+        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        exercise_id INTEGER NOT NULL,
+        weight REAL,
+        sets INTEGER,
+        reps TEXT,
+        log_date DATE DEFAULT (date('now')),
+        FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+        FOREIGN KEY (exercise_id) REFERENCES exercises (exercise_id) ON DELETE CASCADE
+    );
+    PRAGMA user_version = 1;
+"""
+REPS = ("10", "8", "12", "5", "8-12", "6-8")
+
+
+def populate_legacy(rows, users, exercises):
+    """
+    Старый формат: каждая пара (пользователь, упражнение) - еженедельные записи в прошлое от сегодняшнего дня.
+    """
+    per_pair = max(1, rows // (users * exercises))
+    today = date.today()
+    days = [(today - timedelta(days=7 * k)).isoformat() for k in range(per_pair)]
+    data = (
+        (user_id, exercise_id, 40 + (k + user_id) % 40 * 2.5, 3, REPS[(k + exercise_id) % len(REPS)], days[k])
+        for user_id in range(1, users + 1)
+        for exercise_id in range(1, exercises + 1)
+        for k in range(per_pair)
+    )
+    with sqlite3.connect(database.DB_NAME) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+        conn.executemany("INSERT INTO users (user_id) VALUES (?)", ((u,) for u in range(1, users + 1)))
+        conn.executemany(
+            "INSERT INTO exercises (exercise_id, name, muscle_group) VALUES (?, ?, 'bench')",
+            ((e, f"exercise {e}") for e in range(1, exercises + 1)))
+        conn.executemany(
+            "INSERT INTO progress_logs (user_id, exercise_id, weight, sets, reps, log_date) VALUES (?, ?, ?, ?, ?, ?)", data)
+        conn.execute("CREATE INDEX idx_progress_logs_user_exercise_date ON progress_logs (user_id, exercise_id, log_date)")
+    return users * exercises * per_pair
+
+
+def sizes(index_name):
+    with sqlite3.connect(database.DB_NAME) as conn:
+        stat = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    return {
+        'file_mb': round(os.path.getsize(database.DB_NAME) / 2 ** 20, 1),
+        'progress_logs_mb': round(stat.get('progress_logs', 0) / 2 ** 20, 1),
+        'index_mb': round(stat.get(index_name, 0) / 2 ** 20, 1),
+    }
+
+
+def time_scans(query, params, samples, rounds, decode=None, cache_kb=2048):
+    """
+    Диапазонные выборки по случайным (пользователь, упражнение) с маленьким кэшем страниц SQLite.
+    Берется лучший из rounds прогонов, чтобы сгладить шум соседей по хосту.
+    :return: Микросекунд на запрос
+    """
+    conn = sqlite3.connect(database.DB_NAME)
+    conn.execute(f"PRAGMA cache_size = -{cache_kb}")
+    best = None
+    for _ in range(rounds):
+        rng = random.Random(7)
+        started = time.perf_counter()
+        for _ in range(samples):
+            rows = conn.execute(query, params(rng)).fetchall()
+            if decode:
+                rows = [decode(*row) for row in rows]
+        elapsed = (time.perf_counter() - started) / samples * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    conn.close()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк целочисленного формата progress_logs: размер базы и диапазонные выборки")
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--exercises', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    slow_queries.SLOW_QUERY_THRESHOLD_MS = None
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        rows = populate_legacy(args.rows, args.users, args.exercises)
+        print(f"подготовка старого формата: {rows} записей за {time.perf_counter() - started:.1f} с")
+
+        def pick(rng):
+            return rng.randint(1, args.users), rng.randint(1, args.exercises)
+
+        legacy_query = ("SELECT weight, sets, reps, date(log_date) FROM progress_logs "
+                        "WHERE user_id = ? AND exercise_id = ? AND log_date >= date('now', ?) ORDER BY log_date DESC")
+        new_where = " FROM progress_logs WHERE user_id = ? AND exercise_id = ? AND log_day >= ? ORDER BY log_day DESC"
+        raw_query = f"SELECT {database._LOG_COLUMNS}{new_where}"
+        decoded_query = f"SELECT {database._DECODED_LOG_COLUMNS}{new_where}"
+        today = database._today()
+        windows = (30, 180, 3650)
+
+        legacy = {days: time_scans(legacy_query, lambda rng, days=days: (*pick(rng), f'-{days} days'), args.samples, args.rounds)
+                  for days in windows}
+        print("старый формат:", sizes('idx_progress_logs_user_exercise_date'))
+
+        started = time.perf_counter()
+        database.init_schema()
+        migrated = time.perf_counter() - started
+        with sqlite3.connect(database.DB_NAME) as conn:
+            conn.execute("VACUUM")
+        print(f"миграция: {migrated:.1f} с (+ VACUUM {time.perf_counter() - started - migrated:.1f} с)")
+        print("новый формат:", sizes('idx_progress_logs_user_exercise_day'))
+
+        for days in windows:
+            params = lambda rng, days=days: (*pick(rng), today - days)
+            raw = time_scans(raw_query, params, args.samples, args.rounds)
+            in_sql = time_scans(decoded_query, params, args.samples, args.rounds)
+            in_python = time_scans(raw_query, params, args.samples, args.rounds, decode=database._decode_log)
+            print(f"  окно {days} дней: было {legacy[days]:.1f} us/query, get_progress_logs (декодирование в SQL) "
+                  f"{in_sql:.1f} us/query; без декодирования {raw:.1f}, с _decode_log {in_python:.1f}")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import bot_session
+from bot_session import TunedAiohttpSession
+
+TOKEN = '123456:BENCH'
+
+keyboard = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=f"Упражнение {row}-{column}", callback_data=f"log_ex_{row}_{column}") for column in range(3)]
+    for row in range(8)
+])
+
+
+class StandInBotApi:
+    """
+    Локальная замена Bot API: на любой метод отвечает через latency секунд
+    и считает, сколько TCP-соединений открыли клиенты.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.connections = set()
+        self.message_id = 0
+
+    async def handle(self, request):
+        self.connections.add(request.transport.get_extra_info('peername'))
+        await request.post()
+        await asyncio.sleep(self.latency)
+        self.message_id += 1
+        result = {
+            'message_id': self.message_id, 'date': int(time.time()),
+            'chat': {'id': 1, 'type': 'private'}, 'text': 'ok',
+        }
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        return runner, TelegramAPIServer.from_base(f'http://127.0.0.1:{port}')
+
+
+async def burst(session, requests, concurrency):
+    """
+    :return: (секунд на всю пачку, задержки отдельных запросов)
+    """
+    bot = Bot(TOKEN, session=session)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.send_message(1, f"Сообщение {i}", reply_markup=keyboard)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    await session.close()
+    return elapsed, latencies
+
+
+async def run(args):
+    server = StandInBotApi(args.latency_ms / 1000)
+    runner, api = await server.start()
+    sessions = {
+        'по умолчанию (aiogram)': lambda: AiohttpSession(api=api),
+        f'настроенная (pool={args.pool})': lambda: TunedAiohttpSession(
+            api=api, limit=args.pool, limit_per_host=args.pool),
+    }
+    try:
+        for name, make_session in sessions.items():
+            server.connections.clear()
+            await burst(make_session(), min(args.requests, 200), args.concurrency)
+            server.connections.clear()
+            elapsed, latencies = await burst(make_session(), args.requests, args.concurrency)
+            latencies.sort()
+            print(f"{name}: {args.requests / elapsed:.0f} запросов/с, "
+                  f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, "
+                  f"соединений {len(server.connections)}")
+    finally:
+        await runner.cleanup()
+
+
+def json_bench(repeat):
+    value = keyboard.model_dump(exclude_none=True)
+    encoded = json.dumps(value)
+    print(f"json.dumps клавиатуры: {timeit.timeit(lambda: json.dumps(value), number=repeat) / repeat * 1e6:.2f} us, "
+          f"json.loads ответа: {timeit.timeit(lambda: json.loads(encoded), number=repeat) / repeat * 1e6:.2f} us")
+    if bot_session.orjson is not None:
+        print(f"orjson.dumps клавиатуры: "
+              f"{timeit.timeit(lambda: bot_session._orjson_dumps(value), number=repeat) / repeat * 1e6:.2f} us, "
+              f"orjson.loads ответа: "
+              f"{timeit.timeit(lambda: bot_session.orjson.loads(encoded), number=repeat) / repeat * 1e6:.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сессии Bot API против локального сервера-заглушки")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--pool', type=int, default=100)
+    args = parser.parse_args()
+
+    json_bench(20000)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+import slow_queries
+
+database.CATALOG_FILE = os.path.join(ROOT, database.CATALOG_FILE)
+
+
+def setup(tmp, name, shard_count):
+    database.close_connections()
+    database.DB_NAME = os.path.join(tmp, f'{name}.db')
+    database.SHARD_COUNT = shard_count
+    database.init_schema()
+    database.sync_catalog()
+
+
+def register_users(users):
+    for user_id in range(1, users + 1):
+        database.add_user(user_id, 80.0, 180, 30, "М", "Масса", "Средняя")
+    return database._read("SELECT COUNT(*) FROM exercises", one=True)[0]
+
+
+def insert_throughput(users, writers, inserts, hot):
+    """
+    Как в боте: writers корутин цикла событий пишут через db_write, который раскладывает записи
+    по потокам писателей шардов. Потоки одного процесса делят GIL.
+    :param hot: Доля записей, которые идут пользователям нулевого шарда (перекос нагрузки)
+    :return: Кортеж (вставок в секунду, p99 задержки записей в остальные шарды в мс или None)
+    """
+    exercises = register_users(users)
+    shard_count = database.SHARD_COUNT
+    cold_latencies = []
+
+    async def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(inserts):
+            if shard_count > 1 and rng.random() < hot:
+                user_id = rng.randrange(shard_count, users + 1, shard_count)
+            else:
+                user_id = rng.randint(1, users)
+            started = time.perf_counter()
+            await database.db_write(
+                database.add_progress_log, user_id, rng.randint(1, exercises), 60.0, 3, "10", user_id=user_id)
+            if database.shard_for_user(user_id):
+                cold_latencies.append(time.perf_counter() - started)
+
+    async def run():
+        await asyncio.gather(*(worker(seed) for seed in range(writers)))
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    rate = writers * inserts / (time.perf_counter() - started)
+    if not cold_latencies:
+        return rate, None
+    cold_latencies.sort()
+    return rate, cold_latencies[int(len(cold_latencies) * 0.99)] * 1000
+
+
+def process_worker(db_name, shard_count, synchronous, shard_users, exercises, inserts, seed, ready, go):
+    database.DB_NAME = db_name
+    database.SHARD_COUNT = shard_count
+    slow_queries.SLOW_QUERY_THRESHOLD_MS = None
+    use_synchronous(synchronous)
+    rng = random.Random(seed)
+    ready.wait()
+    go.wait()
+    for _ in range(inserts):
+        database.add_progress_log(rng.choice(shard_users), rng.randint(1, exercises), 60.0, 3, "10")
+    database.close_connections()
+
+
+def insert_throughput_processes(users, writers, inserts, shard_count, synchronous):
+    """
+    Отдельные процессы без общего GIL; процесс k пишет только пользователям шарда k % shard_count.
+    При одном шарде все процессы конкурируют за блокировку записи одного файла.
+    """
+    exercises = register_users(users)
+    database.close_connections()
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(writers + 1)
+    go = context.Event()
+    processes = []
+    for seed in range(writers):
+        shard = seed % shard_count
+        shard_users = [user_id for user_id in range(1, users + 1) if user_id % shard_count == shard]
+        process = context.Process(target=process_worker, args=(
+            database.DB_NAME, shard_count, synchronous, shard_users, exercises, inserts, seed, ready, go))
+        process.start()
+        processes.append(process)
+    ready.wait()
+    started = time.perf_counter()
+    go.set()
+    for process in processes:
+        process.join()
+    return writers * inserts / (time.perf_counter() - started)
+
+
+def rebalance_time(tmp, users, logs_per_user, shard_count):
+    setup(tmp, 'rebalance', 1)
+    for user_id in range(1, users + 1):
+        database.add_user(user_id, 80.0, 180, 30, "М", "Масса", "Средняя")
+        plan_id = database.create_workout_plan_with_exercises(user_id, "План", [(1, 3, "10"), (2, 4, "8")])
+        database.set_plan_reminder(user_id, plan_id, 0b10101, 18 * 60, int(time.time()) + 3600)
+        with database._writer(user_id) as conn:
+            conn.executemany(
+                "INSERT INTO progress_logs (user_id, exercise_id, weight_x100, sets, reps) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, 1 + i % 5, 6000, 3, 10) for i in range(logs_per_user)])
+    database.SHARD_COUNT = shard_count
+    started = time.perf_counter()
+    moved = database.rebalance_shards(1)
+    return moved, time.perf_counter() - started
+
+
+def use_synchronous(mode):
+    open_writer = database._Database._open_writer
+
+    def _open_writer(self):
+        conn = open_writer(self)
+        conn.execute(f"PRAGMA synchronous = {mode}")
+        return conn
+
+    database._Database._open_writer = _open_writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк шардирования: пропускная способность вставок и перенос пользователей")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--inserts', type=int, default=2000, help="вставок на поток")
+    parser.add_argument('--rebalance-users', type=int, default=2000)
+    parser.add_argument('--synchronous', choices=['NORMAL', 'FULL'], default='NORMAL',
+                        help="FULL - fsync на каждый коммит, как на диске без кэша записи")
+    parser.add_argument('--processes', action='store_true',
+                        help="писатели - отдельные процессы, а не потоки одного процесса")
+    parser.add_argument('--dir', default=None, help="каталог для файлов баз (по умолчанию временный)")
+    parser.add_argument('--hot', type=float, default=0.0,
+                        help="доля записей в нулевой шард (только для потоков); 0 - равномерно")
+    args = parser.parse_args()
+
+    slow_queries.SLOW_QUERY_THRESHOLD_MS = None
+    use_synchronous(args.synchronous)
+    print(f"CPU: {os.cpu_count()}, synchronous={args.synchronous}, "
+          f"писатели: {args.writers} {'процессов' if args.processes else 'корутин'}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        baseline = None
+        for shard_count in args.shards:
+            setup(tmp, f'insert{shard_count}', shard_count)
+            cold_p99 = None
+            if args.processes:
+                rate = insert_throughput_processes(args.users, args.writers, args.inserts, shard_count, args.synchronous)
+            else:
+                rate, cold_p99 = insert_throughput(args.users, args.writers, args.inserts, args.hot)
+            baseline = baseline or rate
+            print(f"шардов {shard_count}: {rate:.0f} вставок/с (x{rate / baseline:.2f})"
+                  + (f", p99 записи в остальные шарды {cold_p99:.1f} мс" if cold_p99 is not None else ""))
+
+        moved, elapsed = rebalance_time(tmp, args.rebalance_users, 50, max(args.shards))
+        print(f"перенос 1 -> {max(args.shards)} шардов: {moved} пользователей за {elapsed:.2f} с")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import logging
+
+from aiogram.client.session.aiohttp import AiohttpSession
+
+from config import (
+    BOT_API_POOL_SIZE, BOT_API_POOL_PER_HOST, BOT_API_KEEPALIVE,
+    BOT_API_DNS_TTL, BOT_API_DEFAULT_TIMEOUT, BOT_API_TIMEOUTS)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_dumps(value):
+    return orjson.dumps(value).decode('utf-8')
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    Сессия Bot API с настраиваемым пулом соединений (общий размер и лимит на хост),
+    keep-alive, кешем DNS и таймаутами по методам (BOT_API_TIMEOUTS, ключ - имя метода Bot API).
+    JSON кодируется через orjson, если он установлен.
+    """
+
+    def __init__(
+            self, limit=BOT_API_POOL_SIZE, limit_per_host=BOT_API_POOL_PER_HOST, keepalive_timeout=BOT_API_KEEPALIVE,
+            dns_ttl=BOT_API_DNS_TTL, timeout=BOT_API_DEFAULT_TIMEOUT, method_timeouts=BOT_API_TIMEOUTS, **kwargs):
+        if orjson is not None:
+            kwargs.setdefault('json_dumps', _orjson_dumps)
+            kwargs.setdefault('json_loads', orjson.loads)
+        super().__init__(limit=limit, timeout=timeout, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.method_timeouts = dict(method_timeouts)
+        self._checked_session = None
+
+    async def create_session(self):
+        session = await super().create_session()
+        if session is not self._checked_session:
+            self._checked_session = session
+            self._check_connector(session.connector)
+        return session
+
+    def _check_connector(self, connector):
+        """
+        _connector_init - внутренний атрибут aiogram: если после обновления он перестанет доходить
+        до TCPConnector, настройки пула молча потеряются, поэтому сверяем созданный коннектор.
+        """
+        expected = self._connector_init
+        actual = {
+            'limit_per_host': connector.limit_per_host,
+            'keepalive_timeout': getattr(connector, '_keepalive_timeout', None),
+        }
+        for key, value in actual.items():
+            if value != expected[key]:
+                logging.warning(f"Настройка пула Bot API {key} не применилась: ожидалось {expected[key]}, у коннектора {value}")
+
+    async def make_request(self, bot, method, timeout=None):
+        # Явный таймаут вызывающего (например, long polling getUpdates) важнее настроек по методам
+        if timeout is None:
+            timeout = self.method_timeouts.get(method.__api_method__)
+        return await super().make_request(bot, method, timeout)
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from aiogram import BaseMiddleware
+
+from config import UPDATE_MAX_CONCURRENCY, DUPLICATE_CALLBACK_WINDOW
+
+
+class UpdateSerializationMiddleware(BaseMiddleware):
+    """
+    Обрабатывает обновления одного пользователя строго по очереди, разных пользователей - параллельно,
+    но не больше max_concurrency одновременно. Повторное нажатие той же inline-кнопки в течение
+    duplicate_window секунд сразу получает ответ и не доходит до хендлера.
+    """
+
+    def __init__(self, max_concurrency=UPDATE_MAX_CONCURRENCY, duplicate_window=DUPLICATE_CALLBACK_WINDOW):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._duplicate_window = duplicate_window
+        self._locks = {}
+        self._recent_callbacks = {}
+
+    def _is_duplicate(self, callback):
+        now = time.monotonic()
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        key = (callback.from_user.id, message_id, callback.data)
+        seen_at = self._recent_callbacks.get(key)
+        if seen_at is not None and now - seen_at < self._duplicate_window:
+            return True
+        if len(self._recent_callbacks) > 10000:
+            self._recent_callbacks = {
+                key: value for key, value in self._recent_callbacks.items()
+                if now - value < self._duplicate_window
+            }
+        self._recent_callbacks[key] = now
+        return False
+
+    async def _handle(self, handler, event, data):
+        async with self._semaphore:
+            return await handler(event, data)
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is None or event.inline_query is not None:
+            return await self._handle(handler, event, data)
+
+        callback = event.callback_query
+        if callback is not None and self._is_duplicate(callback):
+            await callback.answer()
+            return None
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self._handle(handler, event, data)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
@@ -1 +1,93 @@
 API_TOKEN = ""
+
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = 'slow_queries.jsonl'
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+
+OUTBOUND_GLOBAL_RATE = 30
+OUTBOUND_GLOBAL_BURST = 30
+OUTBOUND_CHAT_RATE = 1
+OUTBOUND_CHAT_BURST = 3
+OUTBOUND_MAX_RETRIES = 3
+OUTBOUND_STATS_INTERVAL = 300
+
+REMINDER_LOOKAHEAD = 3600
+REMINDER_BATCH_SIZE = 500
+REMINDER_MISSED_GRACE = 6 * 3600
+REMINDER_MAX_SLEEP = 60
+
+USER_CACHE_SIZE = 10000
+WARM_ACTIVE_USER_DAYS = 14
+WARM_PAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+ARCHIVE_HORIZON_DAYS = 90
+ARCHIVE_CHUNK_ROWS = 512
+ARCHIVE_BATCH_GROUPS = 200
+MAINTENANCE_INTERVAL = 24 * 3600
+VACUUM_INTERVAL = 15 * 60
+VACUUM_SLICE_PAGES = 256
+VACUUM_SLICE_PAUSE = 0.05
+
+SEARCH_CACHE_SIZE = 4096
+SEARCH_RESULTS_LIMIT = 20
+SEARCH_FUZZY_THRESHOLD = 0.4
+INLINE_CACHE_TIME = 300
+
+TEMPLATE_CACHE_TTL = 300
+TEMPLATE_LIST_LIMIT = 20
+
+READ_POOL_SIZE = 4
+
+SHARD_COUNT = 1
+
+UPDATE_MAX_CONCURRENCY = 32
+DUPLICATE_CALLBACK_WINDOW = 1.0
+
+FSM_MAX_ENTRIES = 50000
+FSM_DEFAULT_TTL = 3600
+FSM_STATE_TTL = {
+    'RegistrationStates': 24 * 3600,
+    'PlanCreationStates': 6 * 3600,
+    'PlanEditingStates': 3600,
+    'LogProgressStates': 3600,
+    'ViewProgressStates': 900,
+    'ProfileEditingStates': 900,
+}
+FSM_STATS_INTERVAL = 300
+
+LEADERBOARD_SIZE = 10
+
+DIGEST_HOUR = 10  # по UTC
+DIGEST_BATCH_USERS = 500
+DIGEST_SEND_WORKERS = 16
+DIGEST_QUEUE_SIZE = 1000
+DIGEST_MISSED_GRACE = 6 * 3600
+
+LOG_MAX_WEIGHT = 1000
+LOG_MAX_SETS = 100
+LOG_MAX_REPS = 1000
+
+RENDER_CACHE_SIZE = 20000
+RENDER_TRACKED_MESSAGES = 50000
+
+ADMIN_IDS = ()
+PROFILE_DIR = 'profiles'
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+PROFILE_TOP_N = 40
+PROFILE_TRACEMALLOC_FRAMES = 10
+
+BOT_API_POOL_SIZE = 100
+BOT_API_POOL_PER_HOST = 100
+BOT_API_KEEPALIVE = 60
+BOT_API_DNS_TTL = 3600
+BOT_API_DEFAULT_TIMEOUT = 20
+BOT_API_TIMEOUTS = {
+    'answerCallbackQuery': 5,
+    'answerInlineQuery': 10,
+    'sendMessage': 15,
+    'editMessageText': 15,
+    'editMessageReplyMarkup': 15,
+    'deleteMessage': 10,
+}
@@ -1,179 +1,1509 @@
 import sqlite3
+import asyncio
 import json
-from datetime import datetime, timedelta
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from archive import pack_logs, unpack_logs
+from config import (
+    USER_CACHE_SIZE, ARCHIVE_CHUNK_ROWS, ARCHIVE_BATCH_GROUPS,
+    TEMPLATE_CACHE_TTL, TEMPLATE_LIST_LIMIT, READ_POOL_SIZE, SHARD_COUNT, LEADERBOARD_SIZE,
+    WARM_ACTIVE_USER_DAYS)
+from slow_queries import record_query
+from tools import (
+    parse_reps_count, estimate_one_rep_max, to_epoch_day, from_epoch_day,
+    encode_weight, decode_weight, encode_reps, decode_reps, WEIGHT_SCALE)
 
 DB_NAME = 'fitness_bot.db'
+SCHEMA_VERSION = 4
+_RECORD_COLUMNS = "max_weight, best_e1rm, best_volume, best_volume_date, day_date, day_volume, max_weight_date, best_e1rm_date"
+_LOG_COLUMNS = "weight_x100, sets, reps, reps_max, reps_text, log_day"
+# То же, что _decode_log, но на стороне SQLite: (вес, подходы, повторения, дата 'YYYY-MM-DD')
+_DECODED_LOG_COLUMNS = (
+    f"weight_x100 / {WEIGHT_SCALE:.1f}, sets, "
+    "CASE WHEN reps_text IS NOT NULL THEN reps_text WHEN reps_max IS NOT NULL THEN reps || '-' || reps_max ELSE CAST(reps AS TEXT) END, "
+    "date(log_day + 2440587.5)"
+)
+CATALOG_FILE = 'exercises.json'
+TEMPLATES_FILE = 'plan_templates.json'
+
+_catalog = {}
+_catalog_by_group = {}
+_catalog_version = 0
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+_user_cache_generation = 0
+_templates_cache = (0.0, None)
+_leaderboards = None
+_leaderboard_members = {}
+_leaderboard_lock = threading.Lock()
+
+class _Database:
+    """
+    Доступ к одному файлу базы: пул соединений только для чтения (mode=ro, query_only)
+    для параллельных чтений под WAL и одно сериализованное соединение для всех изменений.
+    """
+
+    def __init__(self, path, pool_size):
+        self.path = path
+        self._pool_size = pool_size
+        self._readers = queue.SimpleQueue()
+        self._opened_readers = 0
+        self._pool_lock = threading.Lock()
+        self._writer = None
+        self._write_lock = threading.Lock()
+
+    def _open_writer(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _open_reader(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._opened_readers < self._pool_size
+                if can_open:
+                    self._opened_readers += 1
+            conn = self._open_reader() if can_open else self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open_writer()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._pool_lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._opened_readers = 0
+
+
+_shards = []
+_read_executor = ThreadPoolExecutor(READ_POOL_SIZE * SHARD_COUNT, thread_name_prefix='db-read')
+_write_executors = {}
+
+def shard_path(shard):
+    """
+    Путь к файлу шарда: нулевой шард - основная база DB_NAME, остальные лежат рядом с ней.
+    """
+    if shard == 0:
+        return DB_NAME
+    root, ext = os.path.splitext(DB_NAME)
+    return f"{root}.shard{shard}{ext}"
+
+def shard_for_user(user_id):
+    return user_id % SHARD_COUNT
+
+def _get_shards():
+    global _shards
+    if len(_shards) != SHARD_COUNT or _shards[0].path != DB_NAME:
+        close_connections()
+        _shards = [_Database(shard_path(shard), READ_POOL_SIZE) for shard in range(SHARD_COUNT)]
+    return _shards
+
+def close_connections():
+    for database in _shards:
+        database.close()
+
+def _get_database(user_id=None, shard=None):
+    if user_id is not None:
+        shard = shard_for_user(user_id)
+    return _get_shards()[shard or 0]
+
+def _reader(user_id=None, shard=None):
+    return _get_database(user_id, shard).reader()
+
+def _writer(user_id=None, shard=None):
+    return _get_database(user_id, shard).writer()
+
+def _run(conn, query, params=(), fetchone=False, fetchall=False):
+    started = time.perf_counter()
+    cursor = conn.execute(query, params)
+    result = cursor
+    if fetchone:
+        result = cursor.fetchone()
+        cursor.close()
+    elif fetchall:
+        result = cursor.fetchall()
+    record_query(conn, query, params, time.perf_counter() - started)
+    return result
+
+def _run_many(conn, query, seq_of_params):
+    seq_of_params = list(seq_of_params)
+    started = time.perf_counter()
+    conn.executemany(query, seq_of_params)
+    record_query(conn, query, seq_of_params, time.perf_counter() - started, many=True)
+
+def _read(query, params=(), one=False, user_id=None, shard=None):
+    with _reader(user_id, shard) as conn:
+        return _run(conn, query, params, fetchone=one, fetchall=not one)
+
+def _write(query, params=(), user_id=None, shard=None):
+    with _writer(user_id, shard) as conn:
+        return _run(conn, query, params).lastrowid
+
+def _write_many(query, seq_of_params, user_id=None, shard=None):
+    with _writer(user_id, shard) as conn:
+        _run_many(conn, query, seq_of_params)
+
+async def db_read(func, *args, **kwargs):
+    """
+    Выполняет функцию чтения в пуле потоков читателей, не блокируя цикл событий.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_read_executor, partial(func, *args, **kwargs))
 
-def _execute(query, params=(), fetchone=False, fetchall=False, commit=False):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        if commit:
-            conn.commit()
-            return cursor.lastrowid
-        if fetchone:
-            return cursor.fetchone()
-        if fetchall:
-            return cursor.fetchall()
+def _write_executor(shard):
+    """
+    Однопоточный исполнитель записей шарда. Вызывается только из цикла событий.
+    """
+    executor = _write_executors.get(shard)
+    if executor is None:
+        executor = _write_executors[shard] = ThreadPoolExecutor(1, thread_name_prefix=f'db-write-{shard}')
+    return executor
+
+async def db_write(func, *args, user_id=None, shard=None, **kwargs):
+    """
+    Выполняет функцию записи в потоке писателя шарда, не блокируя цикл событий.
+    У каждого шарда свой поток, поэтому очередь записей в один шард не задерживает остальные.
+    :param user_id: Пользователь, в чей шард пишет func; только выбирает поток и в func не передается
+    :param shard: Номер шарда для записей, не привязанных к пользователю; по умолчанию нулевой (общие таблицы)
+    """
+    if user_id is not None:
+        shard = shard_for_user(user_id)
+    return await asyncio.get_running_loop().run_in_executor(_write_executor(shard or 0), partial(func, *args, **kwargs))
 
 def init_db():
-    _execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            weight REAL,
-            height INTEGER,
-            age INTEGER,
-            gender TEXT,
-            target TEXT,
-            activity_level TEXT
-        )
-    ''')
-    _execute('''
-        CREATE TABLE IF NOT EXISTS exercises (
-            exercise_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            muscle_group TEXT NOT NULL,
-            default_sets INTEGER,
-            default_reps TEXT
-        )
-    ''')
-    _execute('''
-        CREATE TABLE IF NOT EXISTS workout_plans (
-            plan_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-        )
-    ''')
-    _execute('''
-        CREATE TABLE IF NOT EXISTS workout_plan_exercises (
-            plan_exercise_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            plan_id INTEGER NOT NULL,
-            exercise_id INTEGER NOT NULL,
-            sets INTEGER,
-            reps TEXT,
-            FOREIGN KEY (plan_id) REFERENCES workout_plans (plan_id) ON DELETE CASCADE,
-            FOREIGN KEY (exercise_id) REFERENCES exercises (exercise_id) ON DELETE CASCADE
-        )
-    ''')
-    _execute('''
+    init_schema()
+    sync_catalog()
+    sync_plan_templates()
+    backfill_personal_records()
+    warm_catalog()
+
+def init_schema():
+    for shard in range(SHARD_COUNT):
+        _init_shard_schema(shard)
+
+def _init_shard_schema(shard):
+    with _writer(shard=shard) as conn:
+        if _run(conn, "PRAGMA auto_vacuum", fetchone=True)[0] != 2:
+            _run(conn, "PRAGMA auto_vacuum = INCREMENTAL")
+            _run(conn, "VACUUM")
+        _run(conn, '''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                weight REAL,
+                height INTEGER,
+                age INTEGER,
+                gender TEXT,
+                target TEXT,
+                activity_level TEXT
+            )
+        ''')
+        _run(conn, '''
+            CREATE TABLE IF NOT EXISTS exercises (
+                exercise_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                muscle_group TEXT NOT NULL,
+                default_sets INTEGER,
+                default_reps TEXT
+            )
+        ''')
+        _run(conn, '''
+            CREATE TABLE IF NOT EXISTS workout_plans (
+                plan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            )
+        ''')
+        if 'version' not in [column[1] for column in _run(conn, "PRAGMA table_info(workout_plans)", fetchall=True)]:
+            _run(conn, "ALTER TABLE workout_plans ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        _run(conn, '''
+            CREATE TABLE IF NOT EXISTS workout_plan_exercises (
+                plan_exercise_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                plan_id INTEGER NOT NULL,
+                exercise_id INTEGER NOT NULL,
+                sets INTEGER,
+                reps TEXT,
+                FOREIGN KEY (plan_id) REFERENCES workout_plans (plan_id) ON DELETE CASCADE,
+                FOREIGN KEY (exercise_id) REFERENCES exercises (exercise_id) ON DELETE CASCADE
+            )
+        ''')
+        _create_progress_logs(conn)
+        _run(conn, '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS exercises_fts USING fts5 (
+                name,
+                muscle_group,
+                content = 'exercises',
+                content_rowid = 'exercise_id',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+        _create_progress_archive(conn)
+        _run(conn, '''
+            CREATE TABLE IF NOT EXISTS reminders (
+                reminder_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                plan_id INTEGER NOT NULL UNIQUE,
+                weekdays INTEGER NOT NULL,
+                minute_of_day INTEGER NOT NULL,
+                next_fire_at INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+                FOREIGN KEY (plan_id) REFERENCES workout_plans (plan_id) ON DELETE CASCADE
+            )
+        ''')
+        _run(conn, "CREATE INDEX IF NOT EXISTS idx_reminders_next_fire ON reminders (next_fire_at, reminder_id)")
+        _run(conn, '''
+            CREATE TABLE IF NOT EXISTS personal_records (
+                user_id INTEGER NOT NULL,
+                exercise_id INTEGER NOT NULL,
+                max_weight REAL NOT NULL,
+                best_e1rm REAL NOT NULL,
+                best_volume REAL NOT NULL,
+                best_volume_date DATE NOT NULL,
+                day_date DATE NOT NULL,
+                day_volume REAL NOT NULL,
+                max_weight_date DATE,
+                best_e1rm_date DATE,
+                PRIMARY KEY (user_id, exercise_id)
+            ) WITHOUT ROWID
+        ''')
+        # Общие для всех пользователей таблицы (шаблоны, рейтинги) живут только в нулевом шарде
+        if shard == 0:
+            _run(conn, '''
+                CREATE TABLE IF NOT EXISTS plan_templates (
+                    template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    author_id INTEGER,
+                    builtin_key TEXT UNIQUE,
+                    source_plan_id INTEGER,
+                    UNIQUE (author_id, source_plan_id)
+                )
+            ''')
+            _run(conn, '''
+                CREATE TABLE IF NOT EXISTS plan_template_exercises (
+                    template_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    exercise_id INTEGER NOT NULL,
+                    sets INTEGER,
+                    reps TEXT,
+                    PRIMARY KEY (template_id, position),
+                    FOREIGN KEY (template_id) REFERENCES plan_templates (template_id) ON DELETE CASCADE,
+                    FOREIGN KEY (exercise_id) REFERENCES exercises (exercise_id) ON DELETE CASCADE
+                ) WITHOUT ROWID
+            ''')
+            _run(conn, '''
+                CREATE TABLE IF NOT EXISTS leaderboard_members (
+                    user_id INTEGER PRIMARY KEY,
+                    display_name TEXT NOT NULL
+                )
+            ''')
+            _run(conn, '''
+                CREATE TABLE IF NOT EXISTS leaderboard_entries (
+                    exercise_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    score REAL NOT NULL,
+                    PRIMARY KEY (exercise_id, user_id)
+                ) WITHOUT ROWID
+            ''')
+        _run(conn, '''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        version = _run(conn, "PRAGMA user_version", fetchone=True)[0]
+        if version < SCHEMA_VERSION:
+            # Все миграции шарда - одна транзакция: DDL сам по себе транзакцию не открывает
+            if not conn.in_transaction:
+                _run(conn, "BEGIN")
+            if version < 1:
+                logging.info(f"Шард {shard}: удалены осиротевшие строки {_sweep_orphans(conn)}")
+            if version < 2:
+                migrated = _migrate_progress_logs(conn)
+                if migrated:
+                    logging.info(f"Шард {shard}: {migrated} записей progress_logs переведены в целочисленный формат")
+            if version < 3:
+                _migrate_progress_archive(conn)
+            if version < 4:
+                _migrate_personal_record_dates(conn)
+            _run(conn, f"PRAGMA user_version = {SCHEMA_VERSION}")
+            violations = _run(conn, "PRAGMA foreign_key_check", fetchall=True)
+            if violations:
+                logging.warning(f"Шард {shard}: {len(violations)} строк нарушают внешние ключи, например {violations[0]}")
+        _run(conn, "CREATE INDEX IF NOT EXISTS idx_progress_logs_user_exercise_day ON progress_logs (user_id, exercise_id, log_day)")
+
+def _create_progress_logs(conn):
+    # log_day - день от 1970-01-01 (UTC), weight_x100 - вес в сотых долях кг,
+    # reps/reps_max - число повторений и верхняя граница диапазона ("8-12"),
+    # reps_text - исходный текст, только если он не восстанавливается из чисел (см. tools.encode_reps)
+    _run(conn, '''
         CREATE TABLE IF NOT EXISTS progress_logs (
             log_id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             exercise_id INTEGER NOT NULL,
-            weight REAL,
+            log_day INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') / 86400 AS INTEGER)),
+            weight_x100 INTEGER,
             sets INTEGER,
-            reps TEXT,
-            log_date DATE DEFAULT (date('now')),
+            reps INTEGER NOT NULL DEFAULT 0,
+            reps_max INTEGER,
+            reps_text TEXT,
             FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
             FOREIGN KEY (exercise_id) REFERENCES exercises (exercise_id) ON DELETE CASCADE
         )
     ''')
-    _load_exercises_from_json()
 
-def _load_exercises_from_json():
-    try:
-        with open('exercises.json', 'r', encoding='utf-8') as f:
-            exercises = json.load(f)
+def _create_progress_archive(conn):
+    # chunk_seq различает блоки одной группы, начинающиеся в один день
+    _run(conn, '''
+        CREATE TABLE IF NOT EXISTS progress_archive (
+            user_id INTEGER NOT NULL,
+            exercise_id INTEGER NOT NULL,
+            first_date DATE NOT NULL,
+            chunk_seq INTEGER NOT NULL DEFAULT 0,
+            last_date DATE NOT NULL,
+            row_count INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            PRIMARY KEY (user_id, exercise_id, first_date, chunk_seq)
+        ) WITHOUT ROWID
+    ''')
+
+def _migrate_progress_archive(conn):
+    """
+    Добавляет chunk_seq в первичный ключ progress_archive. Существующие блоки уникальны по first_date и получают 0.
+    """
+    columns = [column[1] for column in _run(conn, "PRAGMA table_info(progress_archive)", fetchall=True)]
+    if 'chunk_seq' in columns:
+        return
+    _run(conn, "ALTER TABLE progress_archive RENAME TO progress_archive_legacy")
+    _create_progress_archive(conn)
+    _run(conn, '''
+        INSERT INTO progress_archive (user_id, exercise_id, first_date, chunk_seq, last_date, row_count, payload)
+        SELECT user_id, exercise_id, first_date, 0, last_date, row_count, payload FROM progress_archive_legacy
+    ''')
+    _run(conn, "DROP TABLE progress_archive_legacy")
+
+def _migrate_personal_record_dates(conn):
+    """
+    Добавляет даты рекордов веса и 1ПМ. Их нельзя восстановить по таблице рекордов,
+    поэтому отметка personal_records_built снимается и backfill_personal_records пересчитает шард по истории.
+    """
+    columns = [column[1] for column in _run(conn, "PRAGMA table_info(personal_records)", fetchall=True)]
+    if 'max_weight_date' in columns:
+        return
+    _run(conn, "ALTER TABLE personal_records ADD COLUMN max_weight_date DATE")
+    _run(conn, "ALTER TABLE personal_records ADD COLUMN best_e1rm_date DATE")
+    _run(conn, "DELETE FROM meta WHERE key = 'personal_records_built'")
+
+def _encode_log(weight, sets, reps):
+    return (encode_weight(weight), sets, *encode_reps(reps))
+
+def _decode_log(weight_x100, sets, reps, reps_max, reps_text, log_day):
+    """
+    :return: Кортеж (вес, подходы, повторения, дата 'YYYY-MM-DD') - формат get_progress_logs и архива
+    """
+    return decode_weight(weight_x100), sets, decode_reps(reps, reps_max, reps_text), from_epoch_day(log_day)
+
+def _migrate_progress_logs(conn, batch_rows=50000):
+    """
+    Переводит progress_logs из текстового формата (weight REAL, reps TEXT, log_date DATE) в целочисленный.
+    log_id сохраняются, индекс строится после копирования. Записи, нарушающие внешние ключи, не переносятся.
+    :return: Количество перенесенных записей
+    """
+    columns = [column[1] for column in _run(conn, "PRAGMA table_info(progress_logs)", fetchall=True)]
+    if 'log_date' not in columns:
+        return 0
+    _run(conn, "DROP INDEX IF EXISTS idx_progress_logs_user_exercise_date")
+    _run(conn, "ALTER TABLE progress_logs RENAME TO progress_logs_legacy")
+    _create_progress_logs(conn)
+    cursor = conn.execute(
+        """
+            SELECT log_id, user_id, exercise_id, weight, sets, reps, COALESCE(date(log_date), date('now'))
+            FROM progress_logs_legacy
+            WHERE user_id IN (SELECT user_id FROM users) AND exercise_id IN (SELECT exercise_id FROM exercises)
+            ORDER BY log_id
+        """)
+    migrated = 0
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        _run_many(
+            conn,
+            "INSERT INTO progress_logs (log_id, user_id, exercise_id, log_day, weight_x100, sets, reps, reps_max, reps_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(log_id, user_id, exercise_id, to_epoch_day(log_date), *_encode_log(weight, sets, reps))
+             for log_id, user_id, exercise_id, weight, sets, reps, log_date in rows]
+        )
+        migrated += len(rows)
+    skipped = _run(conn, "SELECT COUNT(*) FROM progress_logs_legacy", fetchone=True)[0] - migrated
+    if skipped:
+        logging.warning(f"{skipped} записей progress_logs ссылаются на несуществующих пользователей или упражнения и не перенесены")
+    _run(conn, "DROP TABLE progress_logs_legacy")
+    return migrated
+
+def _today():
+    return int(time.time() // 86400)
+
+def _sweep_orphans(conn):
+    """
+    Однократная миграция: до включения PRAGMA foreign_keys каскадное удаление не работало,
+    и после удаления пользователей и планов оставались их дочерние строки.
+    :return: Словарь {таблица: количество удаленных строк}
+    """
+    live_plans = "SELECT plan_id FROM workout_plans WHERE user_id IN (SELECT user_id FROM users)"
+    # Сначала дочерние таблицы: иначе их строки удалятся каскадом и не попадут в подсчет
+    queries = [
+        ("workout_plan_exercises", f"DELETE FROM workout_plan_exercises WHERE plan_id NOT IN ({live_plans})"),
+        ("reminders", f"DELETE FROM reminders WHERE plan_id NOT IN ({live_plans}) OR user_id NOT IN (SELECT user_id FROM users)"),
+        ("workout_plans", "DELETE FROM workout_plans WHERE user_id NOT IN (SELECT user_id FROM users)"),
+        ("progress_logs", "DELETE FROM progress_logs WHERE user_id NOT IN (SELECT user_id FROM users)"),
+        ("progress_archive", "DELETE FROM progress_archive WHERE user_id NOT IN (SELECT user_id FROM users)"),
+        ("personal_records", "DELETE FROM personal_records WHERE user_id NOT IN (SELECT user_id FROM users)"),
+    ]
+    return {table: _run(conn, query).rowcount for table, query in queries}
 
-        _execute("DELETE FROM exercises", commit=True)
-        
-        _execute("DELETE FROM sqlite_sequence WHERE name='exercises'", commit=True)
+def sync_catalog():
+    """
+    Синхронизирует таблицу exercises с exercises.json. Файл перечитывается только при изменении
+    его содержимого, существующие exercise_id сохраняются. Каталог копируется во все шарды с теми же id.
+    :return: True, если каталог был обновлен
+    """
+    try:
+        with open(CATALOG_FILE, 'rb') as f:
+            raw = f.read()
+        catalog_hash = hashlib.sha256(raw).hexdigest()
+        updated = _get_meta('catalog_hash') != catalog_hash
+        if updated:
+            exercises = json.loads(raw.decode('utf-8'))
+            upsert_query = """
+                INSERT INTO exercises (name, muscle_group, default_sets, default_reps) VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    muscle_group = excluded.muscle_group,
+                    default_sets = excluded.default_sets,
+                    default_reps = excluded.default_reps
+            """
+            _write_many(upsert_query, [(ex['name'], ex['muscle_group'], ex.get('default_sets'), ex.get('default_reps')) for ex in exercises])
+            _set_meta('catalog_hash', catalog_hash)
 
-        insert_query = "INSERT INTO exercises (name, muscle_group, default_sets, default_reps) VALUES (?, ?, ?, ?)"
-        
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            for ex in exercises:
-                cursor.execute(insert_query, (ex['name'], ex['muscle_group'], ex.get('default_sets'), ex.get('default_reps')))
-            conn.commit()
+        if _get_meta('catalog_fts_hash') != catalog_hash:
+            _write("INSERT INTO exercises_fts (exercises_fts) VALUES ('rebuild')")
+            _set_meta('catalog_fts_hash', catalog_hash)
+        _replicate_catalog(catalog_hash)
+        return updated
 
     except (FileNotFoundError, json.JSONDecodeError) as e:
         print(f"Ошибка при загрузке упражнений из exercises.json: {e}")
+        return False
+
+def _replicate_catalog(catalog_hash):
+    rows = None
+    for shard in range(1, SHARD_COUNT):
+        if _get_meta('catalog_hash', shard) == catalog_hash:
+            continue
+        if rows is None:
+            rows = _read("SELECT exercise_id, name, muscle_group, default_sets, default_reps FROM exercises")
+        upsert_query = """
+            INSERT INTO exercises (exercise_id, name, muscle_group, default_sets, default_reps) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(exercise_id) DO UPDATE SET
+                name = excluded.name,
+                muscle_group = excluded.muscle_group,
+                default_sets = excluded.default_sets,
+                default_reps = excluded.default_reps
+        """
+        with _writer(shard=shard) as conn:
+            _run_many(conn, upsert_query, rows)
+            _run(conn, "INSERT OR REPLACE INTO meta (key, value) VALUES ('catalog_hash', ?)", (catalog_hash,))
+
+def sync_plan_templates():
+    """
+    Синхронизирует встроенные шаблоны планов с plan_templates.json (только при изменении файла).
+    :return: True, если шаблоны были обновлены
+    """
+    global _templates_cache
+    try:
+        with open(TEMPLATES_FILE, 'rb') as f:
+            raw = f.read()
+        templates_hash = hashlib.sha256(raw).hexdigest()
+        if _get_meta('templates_hash') == templates_hash:
+            return False
+
+        templates = json.loads(raw.decode('utf-8'))
+        with _writer() as conn:
+            for template in templates:
+                _run(
+                    conn,
+                    "INSERT INTO plan_templates (name, builtin_key) VALUES (?, ?) ON CONFLICT(builtin_key) DO UPDATE SET name = excluded.name",
+                    (template['name'], template['name'])
+                )
+                template_id = _run(conn, "SELECT template_id FROM plan_templates WHERE builtin_key = ?", (template['name'],), fetchone=True)[0]
+                _run(conn, "DELETE FROM plan_template_exercises WHERE template_id = ?", (template_id,))
+                _run_many(
+                    conn,
+                    """
+                        INSERT INTO plan_template_exercises (template_id, position, exercise_id, sets, reps)
+                        SELECT ?, ?, exercise_id, default_sets, default_reps FROM exercises WHERE name = ?
+                    """,
+                    [(template_id, position, name) for position, name in enumerate(template['exercises'])]
+                )
+        _set_meta('templates_hash', templates_hash)
+        _templates_cache = (0.0, None)
+        return True
+
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Ошибка при загрузке шаблонов из plan_templates.json: {e}")
+        return False
+
+def warm_catalog():
+    global _catalog, _catalog_by_group, _catalog_version
+    rows = _read("SELECT exercise_id, name, muscle_group, default_sets, default_reps FROM exercises ORDER BY exercise_id")
+    catalog = {}
+    by_group = {}
+    for exercise_id, name, muscle_group, default_sets, default_reps in rows:
+        catalog[exercise_id] = (name, muscle_group, default_sets, default_reps)
+        by_group.setdefault(muscle_group, []).append((exercise_id, name))
+    _catalog, _catalog_by_group = catalog, by_group
+    _catalog_version += 1
+    return len(catalog)
+
+def get_catalog_version():
+    if not _catalog:
+        warm_catalog()
+    return _catalog_version
+
+def get_catalog_entry(exercise_id):
+    """
+    :return: Кортеж (название, группа_мышц, подходы, повторения) или None
+    """
+    if not _catalog:
+        warm_catalog()
+    return _catalog.get(exercise_id)
+
+def search_exercises_fts(match_expression, limit):
+    query = """
+        SELECT rowid
+        FROM exercises_fts
+        WHERE exercises_fts MATCH ?
+        ORDER BY bm25(exercises_fts, 10.0, 1.0)
+        LIMIT ?
+    """
+    return [row[0] for row in _read(query, (match_expression, limit))]
+
+def warm_user_cache(active_days=WARM_ACTIVE_USER_DAYS, limit=USER_CACHE_SIZE):
+    query = """
+        SELECT recent.last_seen, u.user_id, u.weight, u.height, u.age, u.gender, u.target, u.activity_level
+        FROM users u
+        JOIN (
+            SELECT user_id, MAX(log_day) AS last_seen
+            FROM progress_logs
+            WHERE log_day >= ?
+            GROUP BY user_id
+        ) recent ON recent.user_id = u.user_id
+        ORDER BY recent.last_seen DESC
+        LIMIT ?
+    """
+    generation = _user_cache_generation
+    rows = []
+    for shard in range(SHARD_COUNT):
+        rows.extend(_read(query, (_today() - active_days, limit), shard=shard))
+    rows = sorted(rows, reverse=True)[:limit]
+    for row in reversed(rows):
+        _cache_user(row[1], row[1:], generation)
+    return len(rows)
+
+def warm_page_cache(max_bytes):
+    """
+    Читает файлы шардов, чтобы их страницы оказались в кэше ОС до первых запросов.
+    :return: Количество прочитанных байт
+    """
+    read = 0
+    for shard in range(SHARD_COUNT):
+        try:
+            with open(shard_path(shard), 'rb') as f:
+                while read < max_bytes:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    read += len(chunk)
+        except FileNotFoundError:
+            pass
+    return read
+
+def _get_meta(key, shard=0):
+    row = _read("SELECT value FROM meta WHERE key = ?", (key,), one=True, shard=shard)
+    return row[0] if row else None
+
+def _set_meta(key, value, shard=0):
+    _write("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value), shard=shard)
+
+def _cache_user(user_id, row, generation):
+    """
+    Кладет строку в кэш, только если с момента generation (снят до чтения) ни один пользователь не менялся:
+    иначе строка могла быть прочитана до изменения и перезаписала бы инвалидацию.
+    """
+    with _user_cache_lock:
+        if generation != _user_cache_generation:
+            return
+        _user_cache[user_id] = row
+        _user_cache.move_to_end(user_id)
+        if len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
 
 def get_user(user_id):
-    return _execute("SELECT user_id, weight, height, age, gender, target, activity_level FROM users WHERE user_id = ?", (user_id,), fetchone=True)
+    with _user_cache_lock:
+        row = _user_cache.get(user_id)
+        if row is not None:
+            _user_cache.move_to_end(user_id)
+            return row
+        generation = _user_cache_generation
+    row = _read("SELECT user_id, weight, height, age, gender, target, activity_level FROM users WHERE user_id = ?", (user_id,), one=True, user_id=user_id)
+    if row:
+        _cache_user(user_id, row, generation)
+    return row
+
+def _invalidate_user(user_id):
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        _user_cache.pop(user_id, None)
 
 def add_user(user_id, weight, height, age, gender, target, activity_level):
-    _execute(
-        "INSERT OR REPLACE INTO users (user_id, weight, height, age, gender, target, activity_level) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    # Не INSERT OR REPLACE: замена удаляет строку, и при включенных внешних ключах каскадно удалились бы все данные пользователя
+    _write(
+        """
+            INSERT INTO users (user_id, weight, height, age, gender, target, activity_level) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                weight = excluded.weight,
+                height = excluded.height,
+                age = excluded.age,
+                gender = excluded.gender,
+                target = excluded.target,
+                activity_level = excluded.activity_level
+        """,
         (user_id, weight, height, age, gender, target, activity_level),
-        commit=True
+        user_id=user_id
     )
+    _invalidate_user(user_id)
 
 def delete_user(user_id):
-    _execute("DELETE FROM users WHERE user_id = ?", (user_id,), commit=True)
+    """
+    Удаляет пользователя со всеми данными: планы, их упражнения, напоминания и записи прогресса
+    удаляются каскадно, архив и личные рекорды (без внешних ключей) - явно в той же транзакции.
+    """
+    with _writer(user_id) as conn:
+        _run(conn, "DELETE FROM personal_records WHERE user_id = ?", (user_id,))
+        _run(conn, "DELETE FROM progress_archive WHERE user_id = ?", (user_id,))
+        _run(conn, "DELETE FROM users WHERE user_id = ?", (user_id,))
+    _invalidate_user(user_id)
 
 def update_user_profile(user_id, fields_to_update):
     if not fields_to_update:
         return
     set_clause = ", ".join([f"{key} = ?" for key in fields_to_update.keys()])
     params = list(fields_to_update.values()) + [user_id]
-    _execute(f"UPDATE users SET {set_clause} WHERE user_id = ?", tuple(params), commit=True)
+    _write(f"UPDATE users SET {set_clause} WHERE user_id = ?", tuple(params), user_id=user_id)
+    _invalidate_user(user_id)
 
 def get_exercises_by_muscle_group(muscle_group):
-    return _execute("SELECT exercise_id, name FROM exercises WHERE muscle_group = ?", (muscle_group,), fetchall=True)
+    if not _catalog:
+        warm_catalog()
+    return list(_catalog_by_group.get(muscle_group, []))
 
 def get_all_exercises():
-    return _execute("SELECT exercise_id, name FROM exercises", fetchall=True)
+    if not _catalog:
+        warm_catalog()
+    return [(exercise_id, entry[0]) for exercise_id, entry in _catalog.items()]
+
+def get_exercise_name(exercise_id):
+    if not _catalog:
+        warm_catalog()
+    entry = _catalog.get(exercise_id)
+    return entry[0] if entry else ""
 
 def get_exercise_defaults(exercise_id):
-    return _execute("SELECT default_sets, default_reps FROM exercises WHERE exercise_id = ?", (exercise_id,), fetchone=True)
+    if not _catalog:
+        warm_catalog()
+    entry = _catalog.get(exercise_id)
+    return (entry[2], entry[3]) if entry else None
 
 def get_user_workout_plans(user_id):
-    return _execute("SELECT plan_id, name FROM workout_plans WHERE user_id = ?", (user_id,), fetchall=True)
+    return _read("SELECT plan_id, name FROM workout_plans WHERE user_id = ?", (user_id,), user_id=user_id)
 
 def workout_plan_exists(user_id, plan_name):
-    return _execute("SELECT 1 FROM workout_plans WHERE user_id = ? AND name = ?", (user_id, plan_name), fetchone=True) is not None
+    return _read("SELECT 1 FROM workout_plans WHERE user_id = ? AND name = ?", (user_id, plan_name), one=True, user_id=user_id) is not None
 
 def create_workout_plan(user_id, plan_name):
-    return _execute("INSERT INTO workout_plans (user_id, name) VALUES (?, ?)", (user_id, plan_name), commit=True)
+    return _write("INSERT INTO workout_plans (user_id, name) VALUES (?, ?)", (user_id, plan_name), user_id=user_id)
 
-def add_exercise_to_plan(plan_id, exercise_id, sets, reps):
-    _execute(
-        "INSERT INTO workout_plan_exercises (plan_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
-        (plan_id, exercise_id, sets, reps),
-        commit=True
-    )
+def create_workout_plan_with_exercises(user_id, plan_name, exercises):
+    """
+    Создает план вместе со всеми упражнениями одной транзакцией.
+    :param exercises: Список кортежей (exercise_id, подходы, повторения)
+    :return: plan_id созданного плана или None, если пользователя нет в базе
+    """
+    try:
+        with _writer(user_id) as conn:
+            plan_id = _run(conn, "INSERT INTO workout_plans (user_id, name) VALUES (?, ?)", (user_id, plan_name)).lastrowid
+            _run_many(
+                conn,
+                "INSERT INTO workout_plan_exercises (plan_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
+                [(plan_id, exercise_id, sets, reps) for exercise_id, sets, reps in exercises]
+            )
+    except sqlite3.IntegrityError as e:
+        logging.warning(f"План пользователя {user_id} не сохранен: {e}")
+        return None
+    return plan_id
 
-def get_workout_plan_details(plan_id):
+def add_exercise_to_plan(user_id, plan_id, exercise_id, sets, reps):
+    with _writer(user_id) as conn:
+        _run(
+            conn,
+            """
+                INSERT INTO workout_plan_exercises (plan_id, exercise_id, sets, reps)
+                SELECT plan_id, ?, ?, ? FROM workout_plans WHERE plan_id = ? AND user_id = ?
+            """,
+            (exercise_id, sets, reps, plan_id, user_id)
+        )
+        _run(conn, "UPDATE workout_plans SET version = version + 1 WHERE plan_id = ? AND user_id = ?", (plan_id, user_id))
+
+def get_plan_version(user_id, plan_id):
+    """
+    Версия плана увеличивается при каждом изменении его названия или состава.
+    :return: Кортеж (название, версия) или None
+    """
+    return _read("SELECT name, version FROM workout_plans WHERE plan_id = ? AND user_id = ?", (plan_id, user_id), one=True, user_id=user_id)
+
+def get_workout_plan_details(user_id, plan_id):
     query = """
         SELECT e.name, wpe.sets, wpe.reps
         FROM workout_plan_exercises wpe
+        JOIN workout_plans wp ON wpe.plan_id = wp.plan_id
+        JOIN exercises e ON wpe.exercise_id = e.exercise_id
+        WHERE wpe.plan_id = ? AND wp.user_id = ?
+    """
+    return _read(query, (plan_id, user_id), user_id=user_id)
+
+def get_plan_exercises(user_id, plan_id):
+    query = """
+        SELECT e.exercise_id, e.name
+        FROM workout_plan_exercises wpe
+        JOIN workout_plans wp ON wpe.plan_id = wp.plan_id
         JOIN exercises e ON wpe.exercise_id = e.exercise_id
-        WHERE wpe.plan_id = ?
+        WHERE wpe.plan_id = ? AND wp.user_id = ?
     """
-    return _execute(query, (plan_id,), fetchall=True)
+    return _read(query, (plan_id, user_id), user_id=user_id)
 
-def delete_workout_plan(plan_id):
-    _execute("DELETE FROM workout_plans WHERE plan_id = ?", (plan_id,), commit=True)
+def delete_workout_plan(user_id, plan_id):
+    _write("DELETE FROM workout_plans WHERE plan_id = ? AND user_id = ?", (plan_id, user_id), user_id=user_id)
 
-def update_plan_name(plan_id, new_name):
-    _execute("UPDATE workout_plans SET name = ? WHERE plan_id = ?", (new_name, plan_id), commit=True)
+def update_plan_name(user_id, plan_id, new_name):
+    _write("UPDATE workout_plans SET name = ?, version = version + 1 WHERE plan_id = ? AND user_id = ?", (new_name, plan_id, user_id), user_id=user_id)
 
-def remove_exercise_from_plan(plan_id, exercise_id):
-    _execute(
-        "DELETE FROM workout_plan_exercises WHERE plan_id = ? AND exercise_id = ?",
-        (plan_id, exercise_id),
-        commit=True
-    )
+def remove_exercise_from_plan(user_id, plan_id, exercise_id):
+    with _writer(user_id) as conn:
+        _run(
+            conn,
+            """
+                DELETE FROM workout_plan_exercises
+                WHERE plan_id = (SELECT plan_id FROM workout_plans WHERE plan_id = ? AND user_id = ?) AND exercise_id = ?
+            """,
+            (plan_id, user_id, exercise_id)
+        )
+        _run(conn, "UPDATE workout_plans SET version = version + 1 WHERE plan_id = ? AND user_id = ?", (plan_id, user_id))
 
 def add_progress_log(user_id, exercise_id, weight, sets, reps):
-    _execute(
-        "INSERT INTO progress_logs (user_id, exercise_id, weight, sets, reps) VALUES (?, ?, ?, ?, ?)",
-        (user_id, exercise_id, weight, sets, reps),
-        commit=True
-    )
+    """
+    Записывает результат и в той же транзакции обновляет личные рекорды по упражнению.
+    :return: Словарь побитых рекордов {'weight' | 'e1rm' | 'volume': новое значение}; для первой записи пустой
+    """
+    log_day = _today()
+    log_date = from_epoch_day(log_day)
+    encoded = _encode_log(weight, sets, reps)
+    with _writer(user_id) as conn:
+        _run(
+            conn,
+            "INSERT INTO progress_logs (user_id, exercise_id, log_day, weight_x100, sets, reps, reps_max, reps_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, exercise_id, log_day, *encoded)
+        )
+        record = _run(
+            conn,
+            f"SELECT {_RECORD_COLUMNS} FROM personal_records WHERE user_id = ? AND exercise_id = ?",
+            (user_id, exercise_id),
+            fetchone=True
+        )
+        new_record, improved = _apply_log(record, weight, sets, encoded[2], log_date)
+        _run(
+            conn,
+            f"INSERT OR REPLACE INTO personal_records (user_id, exercise_id, {_RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, exercise_id, *new_record)
+        )
+    if record is None or 'e1rm' in improved:
+        _submit_leaderboard_score(user_id, exercise_id, new_record[1])
+    return improved
+
+def _apply_log(record, weight, sets, reps_count, log_date):
+    """
+    Учитывает одну запись в личных рекордах.
+    :param record: Кортеж в порядке _RECORD_COLUMNS (макс_вес, лучший_1ПМ, лучший_объем, дата_лучшего_объема,
+                   текущий_день, объем_за_день, дата_макс_веса, дата_лучшего_1ПМ) или None
+    :param reps_count: Число повторений (целое, см. tools.encode_reps)
+    :return: Кортеж (новая_запись, побитые_рекорды)
+    """
+    weight = weight or 0
+    e1rm = estimate_one_rep_max(weight, reps_count)
+    volume = weight * (sets or 0) * reps_count
+    if record is None:
+        return (weight, e1rm, volume, log_date, log_date, volume, log_date, log_date), {}
+
+    max_weight, best_e1rm, best_volume, best_volume_date, day_date, day_volume, max_weight_date, best_e1rm_date = record
+    day_volume = day_volume + volume if day_date == log_date else volume
+    improved = {}
+    if weight > max_weight:
+        improved['weight'] = max_weight = weight
+        max_weight_date = log_date
+    if e1rm > best_e1rm:
+        improved['e1rm'] = best_e1rm = e1rm
+        best_e1rm_date = log_date
+    if day_volume > best_volume:
+        improved['volume'] = best_volume = day_volume
+        best_volume_date = log_date
+    return (max_weight, best_e1rm, best_volume, best_volume_date, log_date, day_volume, max_weight_date, best_e1rm_date), improved
+
+def backfill_personal_records():
+    """
+    Однократно строит personal_records по уже накопленной истории (архив и progress_logs) в каждом шарде.
+    :return: Количество построенных записей
+    """
+    built = 0
+    for shard in range(SHARD_COUNT):
+        if _get_meta('personal_records_built', shard):
+            continue
+        records = {}
+        with _reader(shard=shard) as conn:
+            archived = _run(conn, "SELECT user_id, exercise_id, payload FROM progress_archive ORDER BY user_id, exercise_id, first_date, chunk_seq")
+            for user_id, exercise_id, payload in archived:
+                for weight, sets, reps, log_date in unpack_logs(payload):
+                    key = (user_id, exercise_id)
+                    records[key] = _apply_log(records.get(key), weight, sets, parse_reps_count(reps), log_date)[0]
+            logs = _run(conn, "SELECT user_id, exercise_id, weight_x100, sets, reps, log_day FROM progress_logs ORDER BY log_day, log_id")
+            for user_id, exercise_id, weight_x100, sets, reps, log_day in logs:
+                key = (user_id, exercise_id)
+                records[key] = _apply_log(records.get(key), decode_weight(weight_x100), sets, reps, from_epoch_day(log_day))[0]
+        with _writer(shard=shard) as conn:
+            _run_many(
+                conn,
+                f"INSERT OR REPLACE INTO personal_records (user_id, exercise_id, {_RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*key, *record) for key, record in records.items()]
+            )
+            _run(conn, "INSERT OR REPLACE INTO meta (key, value) VALUES ('personal_records_built', '1')")
+        built += len(records)
+    return built
+
+def get_personal_records(user_id, exercise_id):
+    """
+    :return: Кортеж (макс_вес, лучший_1ПМ, лучший_объем, дата_лучшего_объема) или None
+    """
+    return _read(
+        "SELECT max_weight, best_e1rm, best_volume, best_volume_date FROM personal_records WHERE user_id = ? AND exercise_id = ?",
+        (user_id, exercise_id), one=True, user_id=user_id)
+
+def _get_leaderboards():
+    global _leaderboards, _leaderboard_members
+    if _leaderboards is None:
+        members = dict(_read("SELECT user_id, display_name FROM leaderboard_members"))
+        boards = {}
+        for exercise_id, user_id, score in _read("SELECT exercise_id, user_id, score FROM leaderboard_entries ORDER BY exercise_id, score DESC"):
+            boards.setdefault(exercise_id, []).append((score, user_id))
+        _leaderboard_members, _leaderboards = members, boards
+    return _leaderboards
+
+def _submit_leaderboard_score(user_id, exercise_id, score):
+    with _leaderboard_lock:
+        boards = _get_leaderboards()
+        if user_id not in _leaderboard_members:
+            return
+        board = boards.get(exercise_id, [])
+        current = next((entry[0] for entry in board if entry[1] == user_id), None)
+        if current is not None and current >= score:
+            return
+        if current is None and len(board) >= LEADERBOARD_SIZE and score <= board[-1][0]:
+            return
+
+        board = sorted([entry for entry in board if entry[1] != user_id] + [(score, user_id)], reverse=True)
+        with _writer() as conn:
+            _run(
+                conn,
+                "INSERT OR REPLACE INTO leaderboard_entries (exercise_id, user_id, score) VALUES (?, ?, ?)",
+                (exercise_id, user_id, score)
+            )
+            _run_many(
+                conn,
+                "DELETE FROM leaderboard_entries WHERE exercise_id = ? AND user_id = ?",
+                [(exercise_id, dropped_user_id) for _, dropped_user_id in board[LEADERBOARD_SIZE:]]
+            )
+        boards[exercise_id] = board[:LEADERBOARD_SIZE]
+
+def join_leaderboards(user_id, display_name):
+    """
+    Включает пользователя в рейтинги и сразу выставляет его текущие рекорды.
+    """
+    with _leaderboard_lock:
+        _get_leaderboards()
+        _write("INSERT OR REPLACE INTO leaderboard_members (user_id, display_name) VALUES (?, ?)", (user_id, display_name))
+        _leaderboard_members[user_id] = display_name
+    for exercise_id, best_e1rm in _read("SELECT exercise_id, best_e1rm FROM personal_records WHERE user_id = ?", (user_id,), user_id=user_id):
+        _submit_leaderboard_score(user_id, exercise_id, best_e1rm)
+
+def leave_leaderboards(user_id):
+    with _leaderboard_lock:
+        boards = _get_leaderboards()
+        with _writer() as conn:
+            _run(conn, "DELETE FROM leaderboard_members WHERE user_id = ?", (user_id,))
+            _run(conn, "DELETE FROM leaderboard_entries WHERE user_id = ?", (user_id,))
+        _leaderboard_members.pop(user_id, None)
+        for exercise_id, board in boards.items():
+            if any(entry[1] == user_id for entry in board):
+                boards[exercise_id] = _refill_leaderboard(exercise_id, [entry for entry in board if entry[1] != user_id])
+
+def _refill_leaderboard(exercise_id, board):
+    """
+    Дополняет рейтинг до LEADERBOARD_SIZE лучшими результатами остальных участников из personal_records всех шардов:
+    в leaderboard_entries хранится только top-K, и без этого освободившиеся места оставались бы пустыми.
+    :return: Новый рейтинг - список (результат, user_id) по убыванию
+    """
+    on_board = {entry[1] for entry in board}
+    candidates = json.dumps([member_id for member_id in _leaderboard_members if member_id not in on_board])
+    query = """
+        SELECT pr.best_e1rm, pr.user_id
+        FROM json_each(?) AS m
+        CROSS JOIN personal_records pr ON pr.user_id = m.value AND pr.exercise_id = ?
+        ORDER BY pr.best_e1rm DESC
+        LIMIT ?
+    """
+    missing = LEADERBOARD_SIZE - len(board)
+    found = []
+    for shard in range(SHARD_COUNT):
+        found.extend(_read(query, (candidates, exercise_id, missing), shard=shard))
+    added = sorted(found, reverse=True)[:missing]
+    if added:
+        with _writer() as conn:
+            _run_many(
+                conn,
+                "INSERT OR REPLACE INTO leaderboard_entries (exercise_id, user_id, score) VALUES (?, ?, ?)",
+                [(exercise_id, member_id, score) for score, member_id in added]
+            )
+    return sorted(board + added, reverse=True)
+
+def is_leaderboard_member(user_id):
+    with _leaderboard_lock:
+        _get_leaderboards()
+        return user_id in _leaderboard_members
+
+def get_leaderboard(exercise_id):
+    """
+    :return: Список кортежей (user_id, имя, расчетный_1ПМ) по убыванию результата
+    """
+    with _leaderboard_lock:
+        board = _get_leaderboards().get(exercise_id, [])
+        return [(user_id, _leaderboard_members.get(user_id, "?"), score) for score, user_id in board]
+
+def get_progress_version(user_id, exercise_id):
+    """
+    :return: log_id последней записи по упражнению (None, если записей нет)
+    """
+    return _read(
+        "SELECT MAX(log_id) FROM progress_logs WHERE user_id = ? AND exercise_id = ?",
+        (user_id, exercise_id), one=True, user_id=user_id)[0]
 
 def get_progress_logs(user_id, exercise_id, period='all'):
-    base_query = "SELECT weight, sets, reps, date(log_date) FROM progress_logs WHERE user_id = ? AND exercise_id = ?"
+    """
+    :return: Список кортежей (вес, подходы, повторения, дата 'YYYY-MM-DD'), от новых к старым
+    """
+    base_query = f"SELECT {_DECODED_LOG_COLUMNS} FROM progress_logs WHERE user_id = ? AND exercise_id = ?"
     params = [user_id, exercise_id]
 
     if period == 'week':
-        base_query += " AND log_date >= date('now', '-7 days')"
+        base_query += " AND log_day >= ?"
+        params.append(_today() - 7)
     elif period == 'month':
-        base_query += " AND log_date >= date('now', '-30 days')"
+        base_query += " AND log_day >= ?"
+        params.append(_today() - 30)
     
-    base_query += " ORDER BY log_date DESC"
+    base_query += " ORDER BY log_day DESC"
     
-    return _execute(base_query, tuple(params), fetchall=True)
+    logs = _read(base_query, tuple(params), user_id=user_id)
+    if period == 'all':
+        archived = _read(
+            "SELECT payload FROM progress_archive WHERE user_id = ? AND exercise_id = ? ORDER BY first_date DESC, chunk_seq DESC",
+            (user_id, exercise_id), user_id=user_id)
+        for (payload,) in archived:
+            logs.extend(reversed(unpack_logs(payload)))
+        if archived:
+            logs.sort(key=lambda log: log[3], reverse=True)
+    return logs
+
+def archive_progress_logs(horizon_days):
+    """
+    Переносит записи прогресса старше horizon_days дней в сжатые блоки progress_archive
+    (по пользователю и упражнению) во всех шардах. Работает короткими транзакциями по ARCHIVE_BATCH_GROUPS групп.
+    :return: Количество перенесенных записей
+    """
+    cutoff = _today() - horizon_days
+    moved = 0
+    for shard in range(SHARD_COUNT):
+        groups = _read(
+            "SELECT DISTINCT user_id, exercise_id FROM progress_logs WHERE log_day < ? ORDER BY user_id, exercise_id",
+            (cutoff,), shard=shard)
+        for start in range(0, len(groups), ARCHIVE_BATCH_GROUPS):
+            with _writer(shard=shard) as conn:
+                for user_id, exercise_id in groups[start:start + ARCHIVE_BATCH_GROUPS]:
+                    moved += _archive_group(conn, user_id, exercise_id, cutoff)
+    return moved
+
+def _archive_group(conn, user_id, exercise_id, cutoff):
+    logs = [_decode_log(*row) for row in _run(
+        conn,
+        f"SELECT {_LOG_COLUMNS} FROM progress_logs WHERE user_id = ? AND exercise_id = ? AND log_day < ? ORDER BY log_day, log_id",
+        (user_id, exercise_id, cutoff),
+        fetchall=True
+    )]
+    if not logs:
+        return 0
+
+    last_chunk = _run(
+        conn,
+        "SELECT first_date, chunk_seq, row_count, payload FROM progress_archive WHERE user_id = ? AND exercise_id = ? ORDER BY first_date DESC, chunk_seq DESC LIMIT 1",
+        (user_id, exercise_id),
+        fetchone=True
+    )
+    pending = logs
+    if last_chunk and last_chunk[2] < ARCHIVE_CHUNK_ROWS:
+        pending = unpack_logs(last_chunk[3]) + logs
+        _run(
+            conn,
+            "DELETE FROM progress_archive WHERE user_id = ? AND exercise_id = ? AND first_date = ? AND chunk_seq = ?",
+            (user_id, exercise_id, last_chunk[0], last_chunk[1]))
+
+    # Блоки нумеруются по возрастанию внутри группы: несколько блоков могут начинаться в один день
+    chunk_seq = _run(
+        conn,
+        "SELECT COALESCE(MAX(chunk_seq) + 1, 0) FROM progress_archive WHERE user_id = ? AND exercise_id = ?",
+        (user_id, exercise_id),
+        fetchone=True
+    )[0]
+    for offset in range(0, len(pending), ARCHIVE_CHUNK_ROWS):
+        chunk = pending[offset:offset + ARCHIVE_CHUNK_ROWS]
+        _run(
+            conn,
+            "INSERT INTO progress_archive (user_id, exercise_id, first_date, chunk_seq, last_date, row_count, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, exercise_id, chunk[0][3], chunk_seq, chunk[-1][3], len(chunk), pack_logs(chunk))
+        )
+        chunk_seq += 1
+    _run(conn, "DELETE FROM progress_logs WHERE user_id = ? AND exercise_id = ? AND log_day < ?", (user_id, exercise_id, cutoff))
+    return len(logs)
+
+def reclaim_free_pages(max_pages=None):
+    """
+    Возвращает ОС свободные страницы всех шардов через PRAGMA incremental_vacuum.
+    :return: Количество освобожденных страниц
+    """
+    query = f"PRAGMA incremental_vacuum({int(max_pages)})" if max_pages else "PRAGMA incremental_vacuum"
+    reclaimed = 0
+    for shard in range(SHARD_COUNT):
+        with _writer(shard=shard) as conn:
+            before = _run(conn, "PRAGMA freelist_count", fetchone=True)[0]
+            started = time.perf_counter()
+            conn.executescript(query)
+            record_query(conn, query, (), time.perf_counter() - started)
+            reclaimed += before - _run(conn, "PRAGMA freelist_count", fetchone=True)[0]
+    return reclaimed
+
+def reclaim_free_pages_slice(shard, max_pages):
+    """
+    Возвращает ОС не более max_pages свободных страниц шарда одной короткой операцией под блокировкой писателя.
+    :return: Кортеж (освобождено страниц, осталось свободных страниц)
+    """
+    query = f"PRAGMA incremental_vacuum({int(max_pages)})"
+    with _writer(shard=shard) as conn:
+        before = _run(conn, "PRAGMA freelist_count", fetchone=True)[0]
+        if not before:
+            return 0, 0
+        started = time.perf_counter()
+        conn.executescript(query)
+        record_query(conn, query, (), time.perf_counter() - started)
+        after = _run(conn, "PRAGMA freelist_count", fetchone=True)[0]
+    return before - after, after
+
+def set_plan_reminder(user_id, plan_id, weekdays, minute_of_day, next_fire_at):
+    """
+    :return: reminder_id или None, если план уже удален
+    """
+    try:
+        return _write(
+            "INSERT OR REPLACE INTO reminders (user_id, plan_id, weekdays, minute_of_day, next_fire_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, plan_id, weekdays, minute_of_day, next_fire_at),
+            user_id=user_id
+        )
+    except sqlite3.IntegrityError as e:
+        logging.warning(f"Напоминание для плана {plan_id} пользователя {user_id} не сохранено: {e}")
+        return None
+
+def delete_plan_reminder(user_id, plan_id):
+    _write("DELETE FROM reminders WHERE plan_id = ? AND user_id = ?", (plan_id, user_id), user_id=user_id)
+
+def get_plan_reminder(user_id, plan_id):
+    return _read(
+        "SELECT reminder_id, weekdays, minute_of_day, next_fire_at FROM reminders WHERE plan_id = ? AND user_id = ?",
+        (plan_id, user_id), one=True, user_id=user_id)
+
+def get_reminders_page(shard, fire_from, fire_until, after=(0, 0), limit=1000):
+    query = """
+        SELECT reminder_id, next_fire_at
+        FROM reminders
+        WHERE next_fire_at >= ? AND next_fire_at < ? AND (next_fire_at, reminder_id) > (?, ?)
+        ORDER BY next_fire_at, reminder_id
+        LIMIT ?
+    """
+    return _read(query, (fire_from, fire_until, after[0], after[1], limit), shard=shard)
+
+def get_reminders_by_ids(shard, reminder_ids):
+    placeholders = ", ".join("?" for _ in reminder_ids)
+    query = f"""
+        SELECT r.reminder_id, r.user_id, r.plan_id, r.weekdays, r.minute_of_day, r.next_fire_at, wp.name
+        FROM reminders r
+        JOIN workout_plans wp ON r.plan_id = wp.plan_id
+        WHERE r.reminder_id IN ({placeholders})
+    """
+    return _read(query, tuple(reminder_ids), shard=shard)
+
+def reschedule_reminders(shard, updates):
+    _write_many("UPDATE reminders SET next_fire_at = ? WHERE reminder_id = ? AND next_fire_at = ?", updates, shard=shard)
+
+def get_weekly_log_batch(shard, after_user_id, since, until, limit):
+    """
+    Следующая пачка записей для недельной сводки: все записи за дни [since, until) для limit пользователей
+    с user_id больше after_user_id, вместе с их личными рекордами по упражнению.
+    :param since: Номер дня от 1970-01-01 (см. tools.to_epoch_day), until - аналогично
+    :return: Список кортежей (user_id, exercise_id, номер_дня, вес, подходы, число_повторений,
+             день_рекорда_веса, день_рекорда_1ПМ), отсортированный по (user_id, exercise_id, день)
+    """
+    with _reader(shard=shard) as conn:
+        users = _run(
+            conn,
+            "SELECT DISTINCT user_id FROM progress_logs WHERE user_id > ? AND log_day >= ? AND log_day < ? ORDER BY user_id LIMIT ?",
+            (after_user_id, since, until, limit),
+            fetchall=True
+        )
+        if not users:
+            return []
+        query = f"""
+            SELECT l.user_id, l.exercise_id, l.log_day, l.weight_x100 / {WEIGHT_SCALE:.1f}, l.sets, l.reps,
+                   CAST(julianday(pr.max_weight_date) - 2440587.5 AS INTEGER),
+                   CAST(julianday(pr.best_e1rm_date) - 2440587.5 AS INTEGER)
+            FROM progress_logs l
+            LEFT JOIN personal_records pr ON pr.user_id = l.user_id AND pr.exercise_id = l.exercise_id
+            WHERE l.user_id BETWEEN ? AND ? AND l.log_day >= ? AND l.log_day < ?
+            ORDER BY l.user_id, l.exercise_id, l.log_day
+        """
+        return _run(conn, query, (users[0][0], users[-1][0], since, until), fetchall=True)
+
+def get_job_checkpoint(name):
+    value = _get_meta(f"checkpoint:{name}")
+    return json.loads(value) if value else None
+
+def set_job_checkpoint(name, value):
+    _set_meta(f"checkpoint:{name}", json.dumps(value))
+
+def get_plan_templates():
+    """
+    Возвращает встроенные и последние опубликованные шаблоны. Список кэшируется на TEMPLATE_CACHE_TTL секунд.
+    :return: Список кортежей (template_id, название, author_id, количество_упражнений)
+    """
+    global _templates_cache
+    loaded_at, templates = _templates_cache
+    if templates is not None and time.monotonic() - loaded_at < TEMPLATE_CACHE_TTL:
+        return templates
+
+    query = """
+        SELECT t.template_id, t.name, t.author_id, COUNT(te.position)
+        FROM plan_templates t
+        JOIN plan_template_exercises te ON te.template_id = t.template_id
+        WHERE t.template_id IN (
+            SELECT template_id FROM plan_templates WHERE author_id IS NULL
+            UNION ALL
+            SELECT template_id FROM (
+                SELECT template_id FROM plan_templates WHERE author_id IS NOT NULL ORDER BY template_id DESC LIMIT ?
+            )
+        )
+        GROUP BY t.template_id
+        ORDER BY t.author_id IS NOT NULL, t.template_id
+    """
+    templates = _read(query, (TEMPLATE_LIST_LIMIT,))
+    _templates_cache = (time.monotonic(), templates)
+    return templates
+
+def get_plan_template(template_id):
+    query = """
+        SELECT e.name, te.sets, te.reps
+        FROM plan_template_exercises te
+        JOIN exercises e ON te.exercise_id = e.exercise_id
+        WHERE te.template_id = ?
+        ORDER BY te.position
+    """
+    name = _read("SELECT name FROM plan_templates WHERE template_id = ?", (template_id,), one=True)
+    if not name:
+        return None
+    return name[0], _read(query, (template_id,))
+
+def publish_workout_plan(user_id, plan_id):
+    """
+    Публикует снимок плана пользователя как шаблон. Повторная публикация обновляет снимок.
+    План читается из шарда пользователя, шаблоны хранятся в основной базе.
+    :return: template_id или None, если план не найден
+    """
+    global _templates_cache
+    with _reader(user_id) as conn:
+        plan = _run(conn, "SELECT name FROM workout_plans WHERE plan_id = ? AND user_id = ?", (plan_id, user_id), fetchone=True)
+        if not plan:
+            return None
+        exercises = _run(
+            conn,
+            "SELECT plan_exercise_id, exercise_id, sets, reps FROM workout_plan_exercises WHERE plan_id = ?",
+            (plan_id,),
+            fetchall=True
+        )
+
+    with _writer() as conn:
+        _run(
+            conn,
+            "INSERT INTO plan_templates (name, author_id, source_plan_id) VALUES (?, ?, ?) ON CONFLICT(author_id, source_plan_id) DO UPDATE SET name = excluded.name",
+            (plan[0], user_id, plan_id)
+        )
+        template_id = _run(
+            conn,
+            "SELECT template_id FROM plan_templates WHERE author_id = ? AND source_plan_id = ?",
+            (user_id, plan_id),
+            fetchone=True
+        )[0]
+        _run(conn, "DELETE FROM plan_template_exercises WHERE template_id = ?", (template_id,))
+        _run_many(
+            conn,
+            "INSERT INTO plan_template_exercises (template_id, position, exercise_id, sets, reps) VALUES (?, ?, ?, ?, ?)",
+            [(template_id, *exercise) for exercise in exercises]
+        )
+    _templates_cache = (0.0, None)
+    return template_id
+
+def clone_plan_template(user_id, template_id):
+    """
+    Копирует шаблон из основной базы в новый план пользователя одной транзакцией в его шарде.
+    При совпадении названия к нему добавляется номер.
+    :return: Кортеж (plan_id, название) или None, если шаблон не найден или пользователя нет в базе
+    """
+    with _reader() as conn:
+        template = _run(conn, "SELECT name FROM plan_templates WHERE template_id = ?", (template_id,), fetchone=True)
+        if not template:
+            return None
+        exercises = _run(
+            conn,
+            "SELECT exercise_id, sets, reps FROM plan_template_exercises WHERE template_id = ? ORDER BY position",
+            (template_id,),
+            fetchall=True
+        )
+
+    try:
+        with _writer(user_id) as conn:
+            plan_name = template[0]
+            suffix = 1
+            while _run(conn, "SELECT 1 FROM workout_plans WHERE user_id = ? AND name = ?", (user_id, plan_name), fetchone=True):
+                suffix += 1
+                plan_name = f"{template[0]} ({suffix})"
+
+            plan_id = _run(conn, "INSERT INTO workout_plans (user_id, name) VALUES (?, ?)", (user_id, plan_name)).lastrowid
+            _run_many(
+                conn,
+                "INSERT INTO workout_plan_exercises (plan_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
+                [(plan_id, *exercise) for exercise in exercises]
+            )
+    except sqlite3.IntegrityError as e:
+        logging.warning(f"Шаблон {template_id} не скопирован пользователю {user_id}: {e}")
+        return None
+    return plan_id, plan_name
+
+def rebalance_shards(previous_count):
+    """
+    Переносит пользователей, чей шард изменился после смены SHARD_COUNT. Запускать при остановленном боте.
+    :param previous_count: Количество шардов до изменения
+    :return: Количество перенесенных пользователей
+    """
+    init_schema()
+    sync_catalog()
+    sources = []
+    for shard in range(previous_count):
+        if shard < SHARD_COUNT:
+            sources.append(_get_database(shard=shard))
+        elif os.path.exists(shard_path(shard)):
+            sources.append(_Database(shard_path(shard), 1))
+        else:
+            sources.append(None)
+
+    query = """
+        SELECT user_id FROM users
+        UNION SELECT user_id FROM workout_plans
+        UNION SELECT user_id FROM progress_logs
+        UNION SELECT user_id FROM progress_archive
+        UNION SELECT user_id FROM reminders
+        UNION SELECT user_id FROM personal_records
+    """
+    moved = 0
+    try:
+        for shard, source in enumerate(sources):
+            if source is None:
+                continue
+            with source.reader() as conn:
+                user_ids = [row[0] for row in _run(conn, query, fetchall=True)]
+            for user_id in user_ids:
+                if shard_for_user(user_id) != shard and _move_user(user_id, source, _get_database(user_id)):
+                    moved += 1
+    finally:
+        for source in sources[SHARD_COUNT:]:
+            if source is not None:
+                source.close()
+    return moved
+
+def _move_user(user_id, source, target):
+    with source.reader() as conn:
+        user = _run(conn, "SELECT user_id, weight, height, age, gender, target, activity_level FROM users WHERE user_id = ?", (user_id,), fetchall=True)
+        plans = _run(conn, "SELECT plan_id, name, version FROM workout_plans WHERE user_id = ? ORDER BY plan_id", (user_id,), fetchall=True)
+        plan_exercises = _run(
+            conn,
+            """
+                SELECT wpe.plan_id, wpe.exercise_id, wpe.sets, wpe.reps
+                FROM workout_plan_exercises wpe
+                JOIN workout_plans wp ON wpe.plan_id = wp.plan_id
+                WHERE wp.user_id = ?
+                ORDER BY wpe.plan_exercise_id
+            """,
+            (user_id,),
+            fetchall=True
+        )
+        logs = _run(conn, f"SELECT exercise_id, {_LOG_COLUMNS} FROM progress_logs WHERE user_id = ? ORDER BY log_id", (user_id,), fetchall=True)
+        archive = _run(conn, "SELECT exercise_id, first_date, chunk_seq, last_date, row_count, payload FROM progress_archive WHERE user_id = ?", (user_id,), fetchall=True)
+        reminders = _run(conn, "SELECT plan_id, weekdays, minute_of_day, next_fire_at FROM reminders WHERE user_id = ?", (user_id,), fetchall=True)
+        records = _run(
+            conn,
+            f"SELECT exercise_id, {_RECORD_COLUMNS} FROM personal_records WHERE user_id = ?",
+            (user_id,),
+            fetchall=True
+        )
+
+    if not user:
+        # Данные без строки users - осиротевшие, переносить их некуда (внешние ключи)
+        with source.writer() as conn:
+            _delete_user_rows(conn, user_id)
+        return False
+
+    plan_ids = {}
+    with target.writer() as conn:
+        _delete_user_rows(conn, user_id)
+        _run_many(conn, "INSERT INTO users (user_id, weight, height, age, gender, target, activity_level) VALUES (?, ?, ?, ?, ?, ?, ?)", user)
+        for plan_id, name, version in plans:
+            plan_ids[plan_id] = _run(conn, "INSERT INTO workout_plans (user_id, name, version) VALUES (?, ?, ?)", (user_id, name, version)).lastrowid
+        _run_many(
+            conn,
+            "INSERT INTO workout_plan_exercises (plan_id, exercise_id, sets, reps) VALUES (?, ?, ?, ?)",
+            [(plan_ids[plan_id], *rest) for plan_id, *rest in plan_exercises]
+        )
+        _run_many(
+            conn,
+            f"INSERT INTO progress_logs (user_id, exercise_id, {_LOG_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(user_id, *log) for log in logs]
+        )
+        _run_many(
+            conn,
+            "INSERT INTO progress_archive (user_id, exercise_id, first_date, chunk_seq, last_date, row_count, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(user_id, *chunk) for chunk in archive]
+        )
+        _run_many(
+            conn,
+            "INSERT INTO reminders (user_id, plan_id, weekdays, minute_of_day, next_fire_at) VALUES (?, ?, ?, ?, ?)",
+            [(user_id, plan_ids[plan_id], *rest) for plan_id, *rest in reminders if plan_id in plan_ids]
+        )
+        _run_many(
+            conn,
+            f"INSERT INTO personal_records (user_id, exercise_id, {_RECORD_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(user_id, *record) for record in records]
+        )
+
+    # Опубликованные шаблоны (нулевой шард) ссылаются на plan_id автора. Атомарной транзакции между файлами
+    # под WAL нет, поэтому перенумерация идет до удаления из источника и в одной транзакции с отметкой,
+    # на какие plan_id шаблоны указывают сейчас: повторный перенос после сбоя продолжает с нее
+    marker_key = f"plan_move:{user_id}"
+    with _writer() as conn:
+        current = {plan_id: plan_id for plan_id in plan_ids}
+        marker = _run(conn, "SELECT value FROM meta WHERE key = ?", (marker_key,), fetchone=True)
+        if marker:
+            saved = {int(plan_id): moved_id for plan_id, moved_id in json.loads(marker[0]).items()}
+            if saved.keys() == current.keys():
+                current = saved
+        # Меняем знак, чтобы перестановка номеров не нарушила UNIQUE (author_id, source_plan_id)
+        _run_many(
+            conn,
+            "UPDATE plan_templates SET source_plan_id = -? WHERE author_id = ? AND source_plan_id = ?",
+            [(new_plan_id, user_id, current[plan_id]) for plan_id, new_plan_id in plan_ids.items()]
+        )
+        _run(conn, "UPDATE plan_templates SET source_plan_id = -source_plan_id WHERE author_id = ? AND source_plan_id < 0", (user_id,))
+        _run(conn, "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (marker_key, json.dumps(plan_ids)))
+
+    with source.writer() as conn:
+        _delete_user_rows(conn, user_id)
+    with _writer() as conn:
+        _run(conn, "DELETE FROM meta WHERE key = ?", (marker_key,))
+    _invalidate_user(user_id)
+    return True
+
+def _delete_user_rows(conn, user_id):
+    _run(conn, "DELETE FROM personal_records WHERE user_id = ?", (user_id,))
+    _run(conn, "DELETE FROM reminders WHERE user_id = ?", (user_id,))
+    _run(conn, "DELETE FROM progress_archive WHERE user_id = ?", (user_id,))
+    _run(conn, "DELETE FROM progress_logs WHERE user_id = ?", (user_id,))
+    _run(conn, "DELETE FROM workout_plan_exercises WHERE plan_id IN (SELECT plan_id FROM workout_plans WHERE user_id = ?)", (user_id,))
+    _run(conn, "DELETE FROM workout_plans WHERE user_id = ?", (user_id,))
+    _run(conn, "DELETE FROM users WHERE user_id = ?", (user_id,))
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    DIGEST_HOUR, DIGEST_BATCH_USERS, DIGEST_SEND_WORKERS, DIGEST_QUEUE_SIZE, DIGEST_MISSED_GRACE, SHARD_COUNT)
+from database import get_weekly_log_batch, get_job_checkpoint, set_job_checkpoint, db_read, db_write
+from outbound import bulk_sending
+from tools import to_epoch_day
+
+CHECKPOINT_NAME = 'weekly_digest'
+
+
+def summarize_week(rows, week_start):
+    """
+    Сворачивает записи за текущую и прошлую неделю, отсортированные по (user_id, exercise_id, день),
+    в итоги по пользователям за один проход. В памяти держится только текущий пользователь.
+    Рекорд засчитывается по упражнению, только если вес или 1ПМ были побиты в неделю сводки.
+    :param week_start: Первый день недели сводки, номер дня от 1970-01-01
+    :return: Генератор кортежей (user_id, тренировки, объем, объем_прошлой_недели, рекорды)
+    """
+    user = None
+    week_end = week_start + 7
+    for user_id, exercise_id, log_day, weight, sets, reps_count, max_weight_day, best_e1rm_day in rows:
+        if user_id != user:
+            if user is not None and sessions:
+                yield user, len(sessions), volume, previous_volume, records
+            user, sessions, volume, previous_volume, records, record_exercise = user_id, set(), 0.0, 0.0, 0, None
+
+        weight = weight or 0
+        log_volume = weight * (sets or 0) * reps_count
+        if log_day < week_start:
+            previous_volume += log_volume
+            continue
+
+        sessions.add(log_day)
+        volume += log_volume
+        if exercise_id != record_exercise and any(
+                day is not None and week_start <= day < week_end for day in (max_weight_day, best_e1rm_day)):
+            records += 1
+            record_exercise = exercise_id
+    if user is not None and sessions:
+        yield user, len(sessions), volume, previous_volume, records
+
+
+def format_weekly_digest(week_start, sessions, volume, previous_volume, records):
+    week_end = week_start + timedelta(days=6)
+    text = (
+        f"📅 Итоги недели {week_start:%d.%m}–{week_end:%d.%m}\n\n"
+        f"🏋️ Тренировок: {sessions}\n"
+        f"📦 Объем: {volume:.0f} кг"
+    )
+    if previous_volume > 0:
+        text += f" ({(volume - previous_volume) / previous_volume * 100:+.0f}% к прошлой неделе)"
+    text += "\n"
+    if records:
+        text += f"🏆 Личных рекордов: {records}\n"
+    return text
+
+
+async def _deliver_worker(queue, deliver, stats):
+    while True:
+        user_id, text = await queue.get()
+        try:
+            await deliver(user_id, text)
+            stats['sent'] += 1
+        except Exception:
+            stats['failed'] += 1
+        finally:
+            queue.task_done()
+
+
+async def send_weekly_digest(deliver, week_start):
+    """
+    Рассылает итоги недели, начинающейся week_start. Записи читаются пачками по DIGEST_BATCH_USERS
+    пользователей в порядке user_id, после отправки каждой пачки сохраняется контрольная точка,
+    так что после перезапуска рассылка продолжается с места остановки.
+    :param deliver: async-функция (user_id, текст)
+    :param week_start: date, понедельник недели сводки
+    :return: Словарь {'sent': ..., 'failed': ...}
+    """
+    week_key = week_start.isoformat()
+    week_day = to_epoch_day(week_start)
+    since, until = week_day - 7, week_day + 7
+    stats = {'sent': 0, 'failed': 0}
+
+    checkpoint = await db_read(get_job_checkpoint, CHECKPOINT_NAME)
+    shard, after = 0, 0
+    if checkpoint and checkpoint['week'] == week_key:
+        if checkpoint.get('done'):
+            return stats
+        shard, after = checkpoint['shard'], checkpoint['user_id']
+
+    queue = asyncio.Queue(DIGEST_QUEUE_SIZE)
+    workers = [asyncio.create_task(_deliver_worker(queue, deliver, stats)) for _ in range(DIGEST_SEND_WORKERS)]
+    try:
+        while shard < SHARD_COUNT:
+            rows = await db_read(get_weekly_log_batch, shard, after, since, until, DIGEST_BATCH_USERS)
+            if rows:
+                for user_id, *summary in summarize_week(rows, week_day):
+                    await queue.put((user_id, format_weekly_digest(week_start, *summary)))
+                await queue.join()
+                after = rows[-1][0]
+            else:
+                shard, after = shard + 1, 0
+            await db_write(set_job_checkpoint, CHECKPOINT_NAME, {'week': week_key, 'shard': shard, 'user_id': after})
+        await db_write(set_job_checkpoint, CHECKPOINT_NAME, {'week': week_key, 'done': True})
+    finally:
+        for worker in workers:
+            worker.cancel()
+    return stats
+
+
+def _digest_schedule(now):
+    """
+    :param now: Текущее время в UTC, как и номера дней в progress_logs; DIGEST_HOUR тоже задан по UTC
+    :return: Кортеж (понедельник последней завершенной недели, плановое время рассылки за нее, время следующего запуска)
+    """
+    monday = datetime.combine((now - timedelta(days=now.weekday())).date(), datetime.min.time(), tzinfo=now.tzinfo)
+    run_at = monday + timedelta(hours=DIGEST_HOUR)
+    if now < run_at:
+        run_at -= timedelta(days=7)
+    return (run_at - timedelta(days=7)).date(), run_at, run_at + timedelta(days=7)
+
+
+async def skip_weekly_digest(week_start, delay):
+    """
+    Отмечает сводку за неделю как отправленную, не рассылая ее: опоздавшая сводка
+    (первый запуск или перезапуск в конце недели) пришла бы через несколько дней и считала бы рекорды
+    по уже обновленным датам.
+    """
+    week_key = week_start.isoformat()
+    checkpoint = await db_read(get_job_checkpoint, CHECKPOINT_NAME)
+    if checkpoint and checkpoint['week'] == week_key and checkpoint.get('done'):
+        return
+    await db_write(set_job_checkpoint, CHECKPOINT_NAME, {'week': week_key, 'done': True})
+    logging.info(f"Недельная сводка за {week_start} пропущена: запуск опоздал на {delay}")
+
+
+async def run_weekly_digest(bot):
+    async def deliver(user_id, text):
+        with bulk_sending():
+            await bot.send_message(user_id, text)
+
+    while True:
+        now = datetime.now(timezone.utc)
+        week_start, run_at, next_run = _digest_schedule(now)
+        try:
+            if now - run_at > timedelta(seconds=DIGEST_MISSED_GRACE):
+                await skip_weekly_digest(week_start, now - run_at)
+            else:
+                stats = await send_weekly_digest(deliver, week_start)
+                if stats['sent'] or stats['failed']:
+                    logging.info(f"Недельная сводка за {week_start}: отправлено {stats['sent']}, ошибок {stats['failed']}")
+        except Exception:
+            logging.exception("Ошибка при рассылке недельной сводки")
+        await asyncio.sleep(max(60, (next_run - datetime.now(timezone.utc)).total_seconds()))
@@ -1,20 +1,35 @@
 from aiogram import Dispatcher, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-import sqlite3
+from aiogram.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton,
+    InlineQueryResultArticle, InputTextMessageContent)
+from datetime import datetime
+from html import escape
 
 from database import (
     get_user, add_user, delete_user, update_user_profile,
-    get_exercises_by_muscle_group, create_workout_plan, workout_plan_exists,
+    get_exercises_by_muscle_group, create_workout_plan_with_exercises, workout_plan_exists,
     add_exercise_to_plan, get_user_workout_plans,
-    get_workout_plan_details, delete_workout_plan,
-    get_all_exercises, add_progress_log, get_progress_logs,
-    get_exercise_defaults, update_plan_name, remove_exercise_from_plan)
+    get_workout_plan_details, get_plan_exercises, delete_workout_plan,
+    get_exercise_name, add_progress_log, get_progress_logs,
+    get_exercise_defaults, update_plan_name, remove_exercise_from_plan,
+    get_plan_reminder, set_plan_reminder, delete_plan_reminder,
+    get_plan_templates, get_plan_template, publish_workout_plan, clone_plan_template,
+    get_personal_records, get_leaderboard, join_leaderboards, leave_leaderboards, is_leaderboard_member,
+    get_plan_version, get_progress_version, get_catalog_version,
+    db_read, db_write, shard_for_user)
 from states import (
     RegistrationStates, PlanCreationStates, LogProgressStates, 
     ProfileEditingStates, ViewProgressStates, PlanEditingStates)
-from tools import calculate_bmi, calculate_calories
+from tools import (
+    calculate_bmi, calculate_calories,
+    parse_reminder_schedule, format_reminder_schedule, next_reminder_time, max_reps_number)
+from reminders import reminder_scheduler
+from render import render_cache, make_view, edit_view, send_view
+from profiling import live_profiler
+from search import search_exercises
+from config import INLINE_CACHE_TIME, ADMIN_IDS, PROFILE_DEFAULT_SECONDS, LOG_MAX_WEIGHT, LOG_MAX_SETS, LOG_MAX_REPS
 
 
 main_menu_keyboard = ReplyKeyboardMarkup(keyboard=[
@@ -34,6 +49,7 @@ activity_level_keyboard = ReplyKeyboardMarkup(keyboard=[
 
 profile_management_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="✏️ Изменить профиль", callback_data="edit_profile")],
+    [InlineKeyboardButton(text="🏆 Участие в рейтингах", callback_data="toggle_leaderboard")],
     [InlineKeyboardButton(text="🗑️ Сбросить профиль", callback_data="reset_profile")]
 ])
 
@@ -51,7 +67,7 @@ registration_keyboard = InlineKeyboardMarkup(inline_keyboard=[
 muscle_group_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="💪 Грудь", callback_data="mg_Грудь"), InlineKeyboardButton(text="💪 Спина", callback_data="mg_Спина")],
     [InlineKeyboardButton(text="🦵 Ноги", callback_data="mg_Ноги"), InlineKeyboardButton(text="💪 Плечи", callback_data="mg_Плечи")],
-    [InlineKeyboardButton(text="💪 Руки", callback_data="mg_Руки")],
+    [InlineKeyboardButton(text="💪 Руки", callback_data="mg_Руки"), InlineKeyboardButton(text="🔍 Поиск", callback_data="search_exercises")],
     [InlineKeyboardButton(text="✅ Завершить", callback_data="finish_exercises")]
 ])
 
@@ -63,17 +79,55 @@ add_more_exercises_keyboard = InlineKeyboardMarkup(inline_keyboard=[
 progress_filter_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="7️⃣ Неделя", callback_data="progress_week"),
      InlineKeyboardButton(text="🗓️ Месяц", callback_data="progress_month"),
-     InlineKeyboardButton(text="♾️ Все время", callback_data="progress_all")]
+     InlineKeyboardButton(text="♾️ Все время", callback_data="progress_all")],
+    [InlineKeyboardButton(text="🏆 Рекорды и рейтинг", callback_data="show_records")]
 ])
 
+RECORD_NAMES = {
+    'weight': "максимальный вес",
+    'e1rm': "расчетный разовый максимум",
+    'volume': "объем за день",
+}
+
 def get_edit_plan_menu_keyboard(plan_id):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✏️ Переименовать", callback_data=f"rename_plan_{plan_id}")],
         [InlineKeyboardButton(text="➕ Добавить упражнение", callback_data=f"add_ex_to_plan_{plan_id}")],
         [InlineKeyboardButton(text="➖ Удалить упражнение", callback_data=f"remove_ex_from_plan_{plan_id}")],
+        [InlineKeyboardButton(text="⏰ Напоминание", callback_data=f"remind_plan_{plan_id}")],
+        [InlineKeyboardButton(text="📤 Поделиться", callback_data=f"share_plan_{plan_id}")],
         [InlineKeyboardButton(text="↩️ Назад к планам", callback_data="back_to_plans")]
     ])
 
+_templates_keyboard = (None, None)
+
+async def get_templates_keyboard():
+    global _templates_keyboard
+    templates = await db_read(get_plan_templates)
+    if _templates_keyboard[0] is not templates:
+        keyboard_buttons = []
+        for template_id, name, author_id, exercise_count in templates:
+            icon = "📘" if author_id is None else "👤"
+            keyboard_buttons.append([InlineKeyboardButton(text=f"{icon} {name} ({exercise_count})", callback_data=f"tpl_{template_id}")])
+        keyboard_buttons.append([InlineKeyboardButton(text="↩️ Назад к планам", callback_data="back_to_plans_from_view")])
+        _templates_keyboard = (templates, InlineKeyboardMarkup(inline_keyboard=keyboard_buttons))
+    return _templates_keyboard[1]
+
+async def render_template_preview(template_id):
+    template = await db_read(get_plan_template, template_id)
+    if not template:
+        return None, None
+    name, exercises = template
+    # Название шаблона задает автор, поэтому HTML с экранированием, а не Markdown
+    text = f"📚 <b>Шаблон: {escape(name)}</b>\n\n"
+    for exercise_name, sets, reps in exercises:
+        text += f"  - {escape(exercise_name)}: {sets}x{escape(str(reps))}\n"
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Добавить в мои планы", callback_data=f"clone_tpl_{template_id}")],
+        [InlineKeyboardButton(text="↩️ Ко всем шаблонам", callback_data="show_templates")]
+    ])
+    return text, keyboard
+
 
 def register_handlers(dp: Dispatcher):
     dp.message.register(cmd_start, Command("start"))
@@ -82,6 +136,7 @@ def register_handlers(dp: Dispatcher):
     dp.message.register(cmd_calories, lambda message: message.text == "⚖️ Расчет калорий" or message.text == "/calories")
     dp.message.register(cmd_profile, lambda message: message.text == "👤 Профиль" or message.text == "/profile")
     dp.message.register(cmd_help, lambda message: message.text == "❓ Помощь" or message.text == "/help")
+    dp.message.register(cmd_prof, Command("prof"), lambda message: message.from_user.id in ADMIN_IDS)
 
     dp.message.register(process_weight, RegistrationStates.waiting_for_weight)
     dp.message.register(process_height, RegistrationStates.waiting_for_height)
@@ -92,11 +147,15 @@ def register_handlers(dp: Dispatcher):
 
     dp.message.register(process_plan_name, PlanCreationStates.waiting_for_plan_name)
     dp.callback_query.register(process_muscle_group_selection, 
-                               lambda c: c.data.startswith('mg_') or c.data == 'finish_exercises',
+                               lambda c: c.data.startswith('mg_') or c.data in ['finish_exercises', 'search_exercises'],
                                PlanCreationStates.waiting_for_muscle_group)
+    dp.message.register(process_exercise_search, PlanCreationStates.waiting_for_exercise_search)
     dp.callback_query.register(process_exercise_selection, 
                                lambda c: c.data.startswith('ex_') or c.data == 'choose_another_mg',
                                PlanCreationStates.waiting_for_exercise_selection)
+    dp.callback_query.register(process_exercise_selection, 
+                               lambda c: c.data == 'choose_another_mg',
+                               PlanCreationStates.waiting_for_exercise_search)
     dp.callback_query.register(process_add_more_exercises, 
                                lambda c: c.data in ['add_more_exercises', 'finish_plan'], 
                                PlanCreationStates.waiting_for_add_more_exercises)
@@ -109,6 +168,7 @@ def register_handlers(dp: Dispatcher):
     dp.callback_query.register(handle_plan_for_viewing, lambda c: c.data.startswith('view_plan_progress_'), ViewProgressStates.waiting_for_plan_selection)
     dp.callback_query.register(handle_exercise_for_viewing, lambda c: c.data.startswith('view_ex_progress_'), ViewProgressStates.waiting_for_exercise_selection)
     dp.callback_query.register(handle_progress_filter, lambda c: c.data.startswith('progress_'))
+    dp.callback_query.register(handle_show_records, lambda c: c.data == 'show_records')
 
     dp.message.register(process_edited_weight, ProfileEditingStates.editing_weight)
     dp.message.register(process_edited_height, ProfileEditingStates.editing_height)
@@ -118,27 +178,48 @@ def register_handlers(dp: Dispatcher):
     dp.message.register(process_edited_target, ProfileEditingStates.editing_target)
 
     dp.message.register(process_plan_rename, PlanEditingStates.renaming_plan)
+    dp.message.register(process_plan_reminder, PlanEditingStates.setting_reminder)
     dp.callback_query.register(handle_remove_exercise_from_plan, lambda c: c.data.startswith('del_ex_from_plan_'), PlanEditingStates.removing_exercise)
 
+    dp.inline_query.register(handle_inline_search)
+
     dp.callback_query.register(handle_reset_profile, lambda c: c.data == 'reset_profile')
     dp.callback_query.register(handle_edit_profile, lambda c: c.data == 'edit_profile')
+    dp.callback_query.register(handle_toggle_leaderboard, lambda c: c.data == 'toggle_leaderboard')
     dp.callback_query.register(handle_start_registration, lambda c: c.data == 'start_registration')
     dp.callback_query.register(handle_plan_action, lambda c: c.data.startswith(('view_plan_', 'delete_plan_', 'create_new_plan', 'edit_plan_', 'back_to_plans_from_view')))
     dp.callback_query.register(handle_edit_field_selection, lambda c: c.data.startswith('edit_field_') or c.data == 'back_to_profile')
-    dp.callback_query.register(handle_edit_plan_action, lambda c: c.data.startswith(('rename_plan_', 'add_ex_to_plan_', 'remove_ex_from_plan_', 'back_to_plans')))
+    dp.callback_query.register(handle_edit_plan_action, lambda c: c.data.startswith(('rename_plan_', 'add_ex_to_plan_', 'remove_ex_from_plan_', 'remind_plan_', 'share_plan_', 'back_to_plans')))
+    dp.callback_query.register(handle_templates, lambda c: c.data == 'show_templates' or c.data.startswith(('tpl_', 'clone_tpl_')))
+
 
+async def show_template_preview(message: types.Message, template_id):
+    text, keyboard = await render_template_preview(template_id)
+    if text:
+        await message.answer(text, parse_mode="HTML", reply_markup=keyboard)
 
 async def cmd_start(message: types.Message, state: FSMContext):
-    if not get_user(message.from_user.id):
+    payload = message.text.split(maxsplit=1)[1] if len(message.text.split(maxsplit=1)) > 1 else ""
+    template_id = int(payload[4:]) if payload.startswith("tpl_") and payload[4:].isdigit() else None
+    if not await db_read(get_user, message.from_user.id):
+        if template_id is not None:
+            # Шаблон из ссылки покажем после регистрации
+            await state.update_data(pending_template_id=template_id)
         await message.answer("Добро пожаловать! Для начала работы с ботом, давайте зарегистрируемся.", reply_markup=registration_keyboard)
     else:
         await message.answer(f"С возвращением, {message.from_user.first_name}!", reply_markup=main_menu_keyboard)
+        if template_id is not None:
+            await show_template_preview(message, template_id)
 
 async def cmd_plan(message: types.Message, state: FSMContext):
     await state.clear()
-    user_plans = get_user_workout_plans(message.from_user.id)
+    if not await db_read(get_user, message.from_user.id):
+        await message.answer("Вы не зарегистрированы. Пожалуйста, используйте /start для регистрации, чтобы создавать планы.")
+        return
+    user_plans = await db_read(get_user_workout_plans, message.from_user.id)
     if not user_plans:
-        await message.answer("У вас пока нет планов тренировок. Давайте создадим первый! Введите название для вашего нового плана:")
+        templates_button = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="📚 Выбрать готовый шаблон", callback_data="show_templates")]])
+        await message.answer("У вас пока нет планов тренировок. Давайте создадим первый! Введите название для вашего нового плана или выберите готовый шаблон:", reply_markup=templates_button)
         await state.set_state(PlanCreationStates.waiting_for_plan_name)
     else:
         keyboard_buttons = []
@@ -148,14 +229,14 @@ async def cmd_plan(message: types.Message, state: FSMContext):
                 InlineKeyboardButton(text="✏️", callback_data=f"edit_plan_{plan_id}"),
                 InlineKeyboardButton(text="🗑️", callback_data=f"delete_plan_{plan_id}")
             ])
-        keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan")])
+        keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan"), InlineKeyboardButton(text="📚 Шаблоны", callback_data="show_templates")])
         
         plans_keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
         await message.answer("Ваши планы тренировок:", reply_markup=plans_keyboard)
 
 async def cmd_log(message: types.Message, state: FSMContext):
     await state.clear()
-    user_plans = get_user_workout_plans(message.from_user.id)
+    user_plans = await db_read(get_user_workout_plans, message.from_user.id)
     if not user_plans:
         await message.answer("У вас нет планов тренировок для записи прогресса. Сначала создайте план в разделе '📝 Планирование'.")
         return
@@ -171,7 +252,7 @@ async def cmd_log(message: types.Message, state: FSMContext):
     await state.set_state(LogProgressStates.waiting_for_plan_selection)
 
 async def cmd_calories(message: types.Message, state: FSMContext):
-    user_data = get_user(message.from_user.id)
+    user_data = await db_read(get_user, message.from_user.id)
     if user_data:
         user_id, weight, height, age, gender, target, activity_level = user_data
         
@@ -189,26 +270,31 @@ async def cmd_calories(message: types.Message, state: FSMContext):
     else:
         await message.answer("Вы не зарегистрированы. Пожалуйста, используйте /start для регистрации, чтобы рассчитать калории.")
 
+async def render_profile(user_data):
+    user_id, weight, height, age, gender, target, activity_level = user_data
+
+    bmi, bmi_category = calculate_bmi(weight, height)
+
+    profile_text = (
+        f"👤 **Ваш профиль:**\n\n"
+        f"⚖️ Вес: {weight} кг\n"
+        f"📏 Рост: {height} см\n"
+        f"🎂 Возраст: {age}\n"
+        f"🚻 Пол: {gender}\n"
+        f"🎯 Цель: {target}\n"
+        f"🏃‍♂️ Активность: {activity_level}\n\n"
+        f"📈 **ИМТ: {bmi} ({bmi_category})**"
+    )
+    return make_view(profile_text, reply_markup=profile_management_keyboard, parse_mode="Markdown")
+
+async def get_profile_view(user_id):
+    user_data = await db_read(get_user, user_id)
+    if not user_data:
+        return make_view("Вы не зарегистрированы. Пожалуйста, используйте /start для регистрации.")
+    return await render_cache.get_or_render(('profile', *user_data), lambda: render_profile(user_data))
+
 async def cmd_profile(message: types.Message, state: FSMContext):
-    user_data = get_user(message.from_user.id)
-    if user_data:
-        user_id, weight, height, age, gender, target, activity_level = user_data
-        
-        bmi, bmi_category = calculate_bmi(weight, height)
-
-        profile_text = (
-            f"👤 **Ваш профиль:**\n\n"
-            f"⚖️ Вес: {weight} кг\n"
-            f"📏 Рост: {height} см\n"
-            f"🎂 Возраст: {age}\n"
-            f"🚻 Пол: {gender}\n"
-            f"🎯 Цель: {target}\n"
-            f"🏃‍♂️ Активность: {activity_level}\n\n"
-            f"📈 **ИМТ: {bmi} ({bmi_category})**"
-        )
-        await message.answer(profile_text, parse_mode="Markdown", reply_markup=profile_management_keyboard)
-    else:
-        await message.answer("Вы не зарегистрированы. Пожалуйста, используйте /start для регистрации.")
+    await send_view(message, await get_profile_view(message.from_user.id))
 
 async def cmd_help(message: types.Message):
     help_text = (
@@ -222,6 +308,27 @@ async def cmd_help(message: types.Message):
     await message.answer(help_text, parse_mode="Markdown")
 
 
+async def cmd_prof(message: types.Message):
+    """
+    /prof [секунды] [хендлер ...] - профилирование бота, только для ADMIN_IDS.
+    """
+    args = message.text.split()[1:]
+    seconds = PROFILE_DEFAULT_SECONDS
+    if args and args[0].isdigit():
+        seconds = int(args.pop(0))
+
+    async def report(files):
+        await message.answer("Профилирование завершено, файлы:\n" + "\n".join(files))
+
+    try:
+        live_profiler.start(seconds, args, on_finish=report)
+    except (RuntimeError, ValueError) as e:
+        await message.answer(f"❌ {e}")
+        return
+    scope = f" для хендлеров: {', '.join(args)}" if args else ""
+    await message.answer(f"⏱️ Профилирование запущено{scope}, результаты придут по завершении.")
+
+
 async def process_weight(message: types.Message, state: FSMContext):
     try:
         weight = float(message.text.replace(',', '.'))
@@ -291,9 +398,12 @@ async def process_target(message: types.Message, state: FSMContext):
     if target_text in ["Набор массы", "Сброс веса", "Поддержание"]:
         await state.update_data(target=target_text)
         user_data = await state.get_data()
-        add_user(message.from_user.id, **user_data)
+        template_id = user_data.pop('pending_template_id', None)
+        await db_write(add_user, message.from_user.id, user_id=message.from_user.id, **user_data)
         await message.answer("Отлично! Регистрация завершена. Теперь вам доступны все функции бота.", reply_markup=main_menu_keyboard)
         await state.clear()
+        if template_id is not None:
+            await show_template_preview(message, template_id)
     else:
         await message.answer("Пожалуйста, выберите один из вариантов.")
 
@@ -304,24 +414,44 @@ async def process_plan_name(message: types.Message, state: FSMContext):
         await message.answer("Название плана не может быть пустым. Пожалуйста, введите название:")
         return
     
-    if workout_plan_exists(message.from_user.id, plan_name):
+    if await db_read(workout_plan_exists, message.from_user.id, plan_name):
         await message.answer("План с таким названием уже существует. Пожалуйста, введите другое название:")
         return
 
-    plan_id = create_workout_plan(message.from_user.id, plan_name)
-    await state.update_data(current_plan_id=plan_id)
+    await state.update_data(draft_plan_name=plan_name, draft_exercises=[], is_editing=False)
     
     await message.answer(
-        f"План '{plan_name}' создан. Теперь выберите группу мышц для добавления упражнений:",
+        f"План '{plan_name}'. Теперь выберите группу мышц для добавления упражнений:",
         reply_markup=muscle_group_keyboard
     )
     await state.set_state(PlanCreationStates.waiting_for_muscle_group)
 
 
+async def save_plan_draft(callback: types.CallbackQuery, state: FSMContext):
+    """
+    :return: False, если новый план не сохранен, потому что пользователя нет в базе
+    """
+    data = await state.get_data()
+    saved = True
+    if not data.get('is_editing') and data.get('draft_plan_name'):
+        plan_id = await db_write(create_workout_plan_with_exercises, callback.from_user.id, data['draft_plan_name'], data.get('draft_exercises', []), user_id=callback.from_user.id)
+        saved = plan_id is not None
+    await state.clear()
+    return saved
+
 async def process_muscle_group_selection(callback: types.CallbackQuery, state: FSMContext):
     if callback.data == 'finish_exercises':
-        await callback.message.edit_text("Изменения сохранены!")
-        await state.clear()
+        if await save_plan_draft(callback, state):
+            await callback.message.edit_text("Изменения сохранены!")
+        else:
+            await callback.message.edit_text("Вы не зарегистрированы. Пожалуйста, используйте /start для регистрации, чтобы создавать планы.")
+        await callback.answer()
+        return
+
+    if callback.data == 'search_exercises':
+        back_keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="↩️ Назад к группам мышц", callback_data="choose_another_mg")]])
+        await callback.message.edit_text("Введите название упражнения или его часть:", reply_markup=back_keyboard)
+        await state.set_state(PlanCreationStates.waiting_for_exercise_search)
         await callback.answer()
         return
 
@@ -344,6 +474,22 @@ async def process_muscle_group_selection(callback: types.CallbackQuery, state: F
     await state.set_state(PlanCreationStates.waiting_for_exercise_selection)
     await callback.answer()
 
+async def process_exercise_search(message: types.Message, state: FSMContext):
+    results = await db_read(search_exercises, message.text or "")
+    back_button = [InlineKeyboardButton(text="↩️ Назад к группам мышц", callback_data="choose_another_mg")]
+
+    if not results:
+        await message.answer("Ничего не найдено. Попробуйте другой запрос:", reply_markup=InlineKeyboardMarkup(inline_keyboard=[back_button]))
+        return
+
+    exercise_buttons = []
+    for ex_id, ex_name, muscle_group, _, _ in results:
+        exercise_buttons.append([InlineKeyboardButton(text=f"{ex_name} ({muscle_group})", callback_data=f"ex_{ex_id}")])
+    exercise_buttons.append(back_button)
+
+    await message.answer("Результаты поиска:", reply_markup=InlineKeyboardMarkup(inline_keyboard=exercise_buttons))
+    await state.set_state(PlanCreationStates.waiting_for_exercise_selection)
+
 async def process_exercise_selection(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     is_editing = data.get('is_editing', False)
@@ -364,7 +510,13 @@ async def process_exercise_selection(callback: types.CallbackQuery, state: FSMCo
         return
 
     default_sets, default_reps = defaults
-    add_exercise_to_plan(plan_id, exercise_id, default_sets, default_reps)
+    if is_editing:
+        await db_write(add_exercise_to_plan, callback.from_user.id, plan_id, exercise_id, default_sets, default_reps, user_id=callback.from_user.id)
+    else:
+        draft_exercises = data.get('draft_exercises', [])
+        if all(ex[0] != exercise_id for ex in draft_exercises):
+            draft_exercises = draft_exercises + [(exercise_id, default_sets, default_reps)]
+            await state.update_data(draft_exercises=draft_exercises)
     
     if is_editing:
         await callback.message.edit_text("Упражнение добавлено. Что дальше?", reply_markup=get_edit_plan_menu_keyboard(plan_id))
@@ -380,19 +532,17 @@ async def process_add_more_exercises(callback: types.CallbackQuery, state: FSMCo
         await callback.message.edit_text("Выберите группу мышц для добавления следующего упражнения:", reply_markup=muscle_group_keyboard)
         await state.set_state(PlanCreationStates.waiting_for_muscle_group)
     elif callback.data == 'finish_plan':
-        await callback.message.edit_text("План тренировок успешно сохранен!")
-        await state.clear()
+        if await save_plan_draft(callback, state):
+            await callback.message.edit_text("План тренировок успешно сохранен!")
+        else:
+            await callback.message.edit_text("Вы не зарегистрированы. Пожалуйста, используйте /start для регистрации, чтобы создавать планы.")
     await callback.answer()
 
 
 async def handle_plan_for_logging(callback: types.CallbackQuery, state: FSMContext):
     plan_id = int(callback.data.split('_')[-1])
     
-    conn = sqlite3.connect('fitness_bot.db')
-    cur = conn.cursor()
-    cur.execute("SELECT E.exercise_id, E.name FROM WorkoutPlanExercises WPE JOIN Exercises E ON WPE.exercise_id = E.exercise_id WHERE WPE.plan_id = ?", (plan_id,))
-    exercises_in_plan = cur.fetchall()
-    conn.close()
+    exercises_in_plan = await db_read(get_plan_exercises, callback.from_user.id, plan_id)
 
     if not exercises_in_plan:
         await callback.message.edit_text("В этом плане нет упражнений. Добавьте их в разделе '📝 Планирование'.")
@@ -425,14 +575,21 @@ async def process_log_details(message: types.Message, state: FSMContext):
         
         weight = float(parts[0].replace(',', '.'))
         sets = int(parts[1])
-        reps = parts[2]
+        reps = parts[2].strip()
+        # float() принимает "inf" и "nan", а длинные числа не помещаются в INTEGER SQLite
+        if not 0 <= weight <= LOG_MAX_WEIGHT or not 0 <= sets <= LOG_MAX_SETS or max_reps_number(reps) > LOG_MAX_REPS:
+            raise ValueError("Неверный формат")
 
         data = await state.get_data()
         exercise_id = data['log_exercise_id']
         
-        add_progress_log(message.from_user.id, exercise_id, weight, sets, reps)
-        
-        await message.answer("Прогресс успешно записан!", reply_markup=main_menu_keyboard)
+        records = await db_write(add_progress_log, message.from_user.id, exercise_id, weight, sets, reps, user_id=message.from_user.id)
+
+        response_text = "Прогресс успешно записан!"
+        if records:
+            response_text += "\n\n🏆 Новый личный рекорд!\n" + "\n".join(
+                f"  - {RECORD_NAMES[name]}: {value:.1f} кг" for name, value in records.items())
+        await message.answer(response_text, reply_markup=main_menu_keyboard)
         await state.clear()
 
     except (ValueError, IndexError):
@@ -440,7 +597,7 @@ async def process_log_details(message: types.Message, state: FSMContext):
 
 
 async def handle_view_progress_button(callback: types.CallbackQuery, state: FSMContext):
-    user_plans = get_user_workout_plans(callback.from_user.id)
+    user_plans = await db_read(get_user_workout_plans, callback.from_user.id)
     if not user_plans:
         await callback.message.edit_text("У вас нет планов тренировок для просмотра прогресса. Сначала создайте план.")
         await state.clear()
@@ -459,11 +616,7 @@ async def handle_view_progress_button(callback: types.CallbackQuery, state: FSMC
 async def handle_plan_for_viewing(callback: types.CallbackQuery, state: FSMContext):
     plan_id = int(callback.data.split('_')[-1])
     
-    conn = sqlite3.connect('fitness_bot.db')
-    cur = conn.cursor()
-    cur.execute("SELECT E.exercise_id, E.name FROM WorkoutPlanExercises WPE JOIN Exercises E ON WPE.exercise_id = E.exercise_id WHERE WPE.plan_id = ?", (plan_id,))
-    exercises_in_plan = cur.fetchall()
-    conn.close()
+    exercises_in_plan = await db_read(get_plan_exercises, callback.from_user.id, plan_id)
 
     if not exercises_in_plan:
         await callback.message.edit_text("В этом плане нет упражнений.")
@@ -484,30 +637,40 @@ async def handle_exercise_for_viewing(callback: types.CallbackQuery, state: FSMC
     exercise_id = int(callback.data.split('_')[-1])
     await show_progress(callback, state, exercise_id)
 
+async def render_progress(user_id, exercise_id, period, title):
+    logs = await db_read(get_progress_logs, user_id, exercise_id, period=period)
+    if not logs:
+        return None
+
+    response_text = f"**Прогресс для: {title}**\n\n"
+    for log in logs:
+        weight, sets, reps, log_date = log
+        response_text += f"🗓️ {log_date}: {weight}кг x {sets}x{reps}\n"
+    return make_view(response_text, reply_markup=progress_filter_keyboard, parse_mode="Markdown")
+
+async def get_progress_view(user_id, exercise_id, period, title):
+    """
+    Экран прогресса кешируется по последней записи пользователя; для периодов week/month
+    в ключ входит и текущая дата, так как окно выборки сдвигается каждый день.
+    """
+    last_log_id = await db_read(get_progress_version, user_id, exercise_id)
+    day = datetime.utcnow().date() if period != 'all' else None
+    key = ('progress', user_id, exercise_id, period, title, last_log_id, day, get_catalog_version())
+    return await render_cache.get_or_render(key, lambda: render_progress(user_id, exercise_id, period, title))
+
 async def show_progress(callback: types.CallbackQuery, state: FSMContext, exercise_id: int):
     await state.update_data(progress_exercise_id=exercise_id)
     
-    logs = get_progress_logs(callback.from_user.id, exercise_id, period='all')
-    
-    exercise_name = ""
-    all_exercises = get_all_exercises()
-    for ex_id, ex_name in all_exercises:
-        if ex_id == exercise_id:
-            exercise_name = ex_name
-            break
+    exercise_name = get_exercise_name(exercise_id)
+    view = await get_progress_view(callback.from_user.id, exercise_id, 'all', exercise_name)
 
-    if not logs:
+    if not view:
         await callback.message.edit_text(f"Пока нет записей для упражнения '{exercise_name}'.", reply_markup=None)
         await state.clear()
         await callback.answer()
         return
 
-    response_text = f"**Прогресс для: {exercise_name}**\n\n"
-    for log in logs:
-        weight, sets, reps, log_date = log
-        response_text += f"🗓️ {log_date}: {weight}кг x {sets}x{reps}\n"
-        
-    await callback.message.edit_text(response_text, reply_markup=progress_filter_keyboard, parse_mode="Markdown")
+    await edit_view(callback.message, view)
     await callback.answer()
 
 async def handle_progress_filter(callback: types.CallbackQuery, state: FSMContext):
@@ -520,26 +683,13 @@ async def handle_progress_filter(callback: types.CallbackQuery, state: FSMContex
         await state.clear()
         return
 
-    logs = get_progress_logs(callback.from_user.id, exercise_id, period=period)
-    
-    exercise_name = ""
-    all_exercises = get_all_exercises()
-    for ex_id, ex_name in all_exercises:
-        if ex_id == exercise_id:
-            exercise_name = ex_name
-            break
+    exercise_name = get_exercise_name(exercise_id)
+    view = await get_progress_view(callback.from_user.id, exercise_id, period, f"{exercise_name} ({period})")
 
-    if not logs:
-        await callback.message.edit_text(f"Нет записей для упражнения '{exercise_name}' за выбранный период.", reply_markup=progress_filter_keyboard)
-        await callback.answer()
-        return
+    if not view:
+        view = make_view(f"Нет записей для упражнения '{exercise_name}' за выбранный период.", reply_markup=progress_filter_keyboard)
 
-    response_text = f"**Прогресс для: {exercise_name} ({period})**\n\n"
-    for log in logs:
-        weight, sets, reps, log_date = log
-        response_text += f"🗓️ {log_date}: {weight}кг x {sets}x{reps}\n"
-        
-    await callback.message.edit_text(response_text, reply_markup=progress_filter_keyboard, parse_mode="Markdown")
+    await edit_view(callback.message, view)
     await callback.answer()
 
 
@@ -548,7 +698,7 @@ async def process_edited_weight(message: types.Message, state: FSMContext):
         weight = float(message.text.replace(',', '.'))
         if not (20 < weight < 300):
             raise ValueError("Неправдоподобный вес.")
-        update_user_profile(message.from_user.id, {'weight': weight})
+        await db_write(update_user_profile, message.from_user.id, {'weight': weight}, user_id=message.from_user.id)
         await message.answer("Вес успешно обновлен.")
         await state.clear()
         await cmd_profile(message, state)
@@ -560,7 +710,7 @@ async def process_edited_height(message: types.Message, state: FSMContext):
         height = int(message.text)
         if not (100 < height < 250):
             raise ValueError("Неправдоподобный рост.")
-        update_user_profile(message.from_user.id, {'height': height})
+        await db_write(update_user_profile, message.from_user.id, {'height': height}, user_id=message.from_user.id)
         await message.answer("Рост успешно обновлен.")
         await state.clear()
         await cmd_profile(message, state)
@@ -572,7 +722,7 @@ async def process_edited_age(message: types.Message, state: FSMContext):
         age = int(message.text)
         if not (12 < age < 100):
             raise ValueError("Неправдоподобный возраст.")
-        update_user_profile(message.from_user.id, {'age': age})
+        await db_write(update_user_profile, message.from_user.id, {'age': age}, user_id=message.from_user.id)
         await message.answer("Возраст успешно обновлен.")
         await state.clear()
         await cmd_profile(message, state)
@@ -581,7 +731,7 @@ async def process_edited_age(message: types.Message, state: FSMContext):
 
 async def process_edited_gender(message: types.Message, state: FSMContext):
     if message.text in ["👨 Мужской", "👩 Женский"]:
-        update_user_profile(message.from_user.id, {'gender': message.text.split(" ")[1]})
+        await db_write(update_user_profile, message.from_user.id, {'gender': message.text.split(" ")[1]}, user_id=message.from_user.id)
         await message.answer("Пол успешно обновлен.", reply_markup=main_menu_keyboard)
         await state.clear()
         await cmd_profile(message, state)
@@ -590,7 +740,7 @@ async def process_edited_gender(message: types.Message, state: FSMContext):
 
 async def process_edited_activity(message: types.Message, state: FSMContext):
     if message.text.split(" ")[1] in ["Минимальная", "Легкая", "Средняя", "Высокая"]:
-        update_user_profile(message.from_user.id, {'activity_level': message.text.split(" ")[1]})
+        await db_write(update_user_profile, message.from_user.id, {'activity_level': message.text.split(" ")[1]}, user_id=message.from_user.id)
         await message.answer("Уровень активности успешно обновлен.", reply_markup=main_menu_keyboard)
         await state.clear()
         await cmd_profile(message, state)
@@ -599,7 +749,7 @@ async def process_edited_activity(message: types.Message, state: FSMContext):
 
 async def process_edited_target(message: types.Message, state: FSMContext):
     if message.text.split(" ")[1] in ["Набор массы", "Сброс веса", "Поддержание"]:
-        update_user_profile(message.from_user.id, {'target': message.text.split(" ")[1]})
+        await db_write(update_user_profile, message.from_user.id, {'target': message.text.split(" ")[1]}, user_id=message.from_user.id)
         await message.answer("Цель успешно обновлена.", reply_markup=main_menu_keyboard)
         await state.clear()
         await cmd_profile(message, state)
@@ -607,11 +757,65 @@ async def process_edited_target(message: types.Message, state: FSMContext):
         await message.answer("Пожалуйста, выберите один из предложенных вариантов.", reply_markup=target_keyboard)
 
 
+async def handle_inline_search(inline_query: types.InlineQuery):
+    results = []
+    for ex_id, ex_name, muscle_group, default_sets, default_reps in await db_read(search_exercises, inline_query.query):
+        results.append(InlineQueryResultArticle(
+            id=str(ex_id),
+            title=ex_name,
+            description=f"{muscle_group} · {default_sets}x{default_reps}",
+            input_message_content=InputTextMessageContent(message_text=f"🏋️ {ex_name} ({muscle_group}): {default_sets}x{default_reps}")
+        ))
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+
 async def handle_reset_profile(callback: types.CallbackQuery, state: FSMContext):
-    delete_user(callback.from_user.id)
+    await db_write(delete_user, callback.from_user.id, user_id=callback.from_user.id)
+    await db_write(leave_leaderboards, callback.from_user.id)
     await callback.message.edit_text("Ваш профиль был сброшен. Для повторной регистрации используйте команду /start.")
     await callback.answer()
 
+async def handle_show_records(callback: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    exercise_id = data.get('progress_exercise_id')
+    if not exercise_id:
+        await callback.message.edit_text("Произошла ошибка. Пожалуйста, попробуйте снова, выбрав упражнение.")
+        await state.clear()
+        return
+
+    records = await db_read(get_personal_records, callback.from_user.id, exercise_id)
+    leaderboard = await db_read(get_leaderboard, exercise_id)
+
+    response_text = f"**Рекорды: {get_exercise_name(exercise_id)}**\n\n"
+    if records:
+        max_weight, best_e1rm, best_volume, best_volume_date = records
+        response_text += (
+            f"🏋️ Максимальный вес: {max_weight:.1f} кг\n"
+            f"💥 Расчетный разовый максимум: {best_e1rm:.1f} кг\n"
+            f"📦 Лучший объем за день: {best_volume:.1f} кг ({best_volume_date})\n"
+        )
+    else:
+        response_text += "Пока нет записей.\n"
+
+    response_text += "\n**Рейтинг по расчетному максимуму:**\n"
+    if leaderboard:
+        for position, (user_id, name, score) in enumerate(leaderboard, 1):
+            marker = " ⬅️" if user_id == callback.from_user.id else ""
+            response_text += f"{position}. {name}: {score:.1f} кг{marker}\n"
+    else:
+        response_text += "Пока никто не участвует. Включить участие можно в профиле.\n"
+
+    await callback.message.edit_text(response_text, reply_markup=progress_filter_keyboard, parse_mode="Markdown")
+    await callback.answer()
+
+async def handle_toggle_leaderboard(callback: types.CallbackQuery, state: FSMContext):
+    if await db_read(is_leaderboard_member, callback.from_user.id):
+        await db_write(leave_leaderboards, callback.from_user.id)
+        await callback.answer("Вы больше не участвуете в рейтингах.", show_alert=True)
+    else:
+        display_name = callback.from_user.first_name.translate(str.maketrans("", "", "*_`["))
+        await db_write(join_leaderboards, callback.from_user.id, display_name)
+        await callback.answer(f"Вы участвуете в рейтингах под именем {display_name}.", show_alert=True)
+
 async def handle_edit_profile(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_text("Какое поле вы хотите изменить?", reply_markup=edit_profile_keyboard)
     await callback.answer()
@@ -621,13 +825,24 @@ async def handle_start_registration(callback: types.CallbackQuery, state: FSMCon
     await state.set_state(RegistrationStates.waiting_for_weight)
     await callback.answer()
 
+async def render_plan(user_id, plan_id, plan_name):
+    plan_details = await db_read(get_workout_plan_details, user_id, plan_id)
+    if not plan_details:
+        return make_view("В этом плане пока нет упражнений.")
+
+    details_text = f"🏋️‍♂️ <b>План тренировок: {escape(plan_name)}</b>\n\n"
+    for exercise_name, sets, reps in plan_details:
+        details_text += f"  - {escape(exercise_name)}: {sets}x{escape(str(reps))}\n"
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="↩️ Назад к планам", callback_data="back_to_plans_from_view")]])
+    return make_view(details_text, reply_markup=keyboard, parse_mode="HTML")
+
 async def handle_plan_action(callback: types.CallbackQuery, state: FSMContext):
     action_parts = callback.data.split('_')
     action = action_parts[0]
 
     if callback.data == 'back_to_plans_from_view':
         await state.clear()
-        user_plans = get_user_workout_plans(callback.from_user.id)
+        user_plans = await db_read(get_user_workout_plans, callback.from_user.id)
         keyboard_buttons = []
         for p_id, p_name in user_plans:
             keyboard_buttons.append([
@@ -635,38 +850,31 @@ async def handle_plan_action(callback: types.CallbackQuery, state: FSMContext):
                 InlineKeyboardButton(text="✏️", callback_data=f"edit_plan_{p_id}"),
                 InlineKeyboardButton(text="🗑️", callback_data=f"delete_plan_{p_id}")
             ])
-        keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan")])
+        keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan"), InlineKeyboardButton(text="📚 Шаблоны", callback_data="show_templates")])
         plans_keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-        await callback.message.edit_text("Ваши планы тренировок:", reply_markup=plans_keyboard)
+        await edit_view(callback.message, make_view("Ваши планы тренировок:", reply_markup=plans_keyboard))
         await callback.answer()
         return
 
     if action == 'view':
         plan_id = int(action_parts[2])
-        plan_details = get_workout_plan_details(plan_id)
-        
-        if plan_details:
-            plan_name = "Ваш план"
-            user_plans = get_user_workout_plans(callback.from_user.id)
-            for p_id, p_name in user_plans:
-                if p_id == plan_id:
-                    plan_name = p_name
-                    break
-
-            details_text = f"🏋️‍♂️ **План тренировок: {plan_name}**\n\n"
-            for exercise_name, sets, reps in plan_details:
-                details_text += f"  - {exercise_name}: {sets}x{reps}\n"
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="↩️ Назад к планам", callback_data="back_to_plans_from_view")]])
-            await callback.message.edit_text(details_text, parse_mode="Markdown", reply_markup=keyboard)
+        user_id = callback.from_user.id
+        plan = await db_read(get_plan_version, user_id, plan_id)
+
+        if plan:
+            plan_name, version = plan
+            key = ('plan', user_id, plan_id, version, get_catalog_version())
+            view = await render_cache.get_or_render(key, lambda: render_plan(user_id, plan_id, plan_name))
         else:
-            await callback.message.edit_text("В этом плане пока нет упражнений.")
+            view = make_view("В этом плане пока нет упражнений.")
+        await edit_view(callback.message, view)
         await callback.answer()
 
     elif action == 'delete':
         plan_id = int(action_parts[2])
-        delete_workout_plan(plan_id)
+        await db_write(delete_workout_plan, callback.from_user.id, plan_id, user_id=callback.from_user.id)
         
-        user_plans = get_user_workout_plans(callback.from_user.id)
+        user_plans = await db_read(get_user_workout_plans, callback.from_user.id)
         if not user_plans:
             await callback.message.edit_text("План удален. У вас больше нет планов.\n\nЧтобы создать новый, введите команду /plan или нажмите '📝 Планирование'.", reply_markup=None)
         else:
@@ -677,7 +885,7 @@ async def handle_plan_action(callback: types.CallbackQuery, state: FSMContext):
                     InlineKeyboardButton(text="✏️", callback_data=f"edit_plan_{p_id}"),
                     InlineKeyboardButton(text="🗑️", callback_data=f"delete_plan_{p_id}")
                 ])
-            keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan")])
+            keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan"), InlineKeyboardButton(text="📚 Шаблоны", callback_data="show_templates")])
             plans_keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
             await callback.message.edit_text("План удален. Ваши планы тренировок:", reply_markup=plans_keyboard)
         await callback.answer()
@@ -695,13 +903,36 @@ async def handle_plan_action(callback: types.CallbackQuery, state: FSMContext):
         await callback.answer()
 
 
+async def handle_templates(callback: types.CallbackQuery, state: FSMContext):
+    if callback.data == 'show_templates':
+        await callback.message.edit_text("Готовые шаблоны планов:", reply_markup=await get_templates_keyboard())
+    elif callback.data.startswith('tpl_'):
+        text, keyboard = await render_template_preview(int(callback.data.split('_')[-1]))
+        if text:
+            await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+        else:
+            await callback.message.edit_text("Шаблон не найден.", reply_markup=await get_templates_keyboard())
+    else:
+        await state.clear()
+        if not await db_read(get_user, callback.from_user.id):
+            await callback.message.edit_text("Вы не зарегистрированы. Пожалуйста, используйте /start для регистрации, чтобы создавать планы.")
+            await callback.answer()
+            return
+        cloned = await db_write(clone_plan_template, callback.from_user.id, int(callback.data.split('_')[-1]), user_id=callback.from_user.id)
+        if cloned:
+            plan_id, plan_name = cloned
+            await callback.message.edit_text(f"План '{plan_name}' добавлен в ваши планы.", reply_markup=get_edit_plan_menu_keyboard(plan_id))
+        else:
+            await callback.message.edit_text("Шаблон не найден.", reply_markup=await get_templates_keyboard())
+    await callback.answer()
+
 async def handle_edit_plan_action(callback: types.CallbackQuery, state: FSMContext):
     action_parts = callback.data.split('_')
     action = action_parts[0]
     
     if action == 'back':
         await state.clear()
-        user_plans = get_user_workout_plans(callback.from_user.id)
+        user_plans = await db_read(get_user_workout_plans, callback.from_user.id)
         keyboard_buttons = []
         if user_plans:
             for p_id, p_name in user_plans:
@@ -710,9 +941,9 @@ async def handle_edit_plan_action(callback: types.CallbackQuery, state: FSMConte
                     InlineKeyboardButton(text="✏️", callback_data=f"edit_plan_{p_id}"),
                     InlineKeyboardButton(text="🗑️", callback_data=f"delete_plan_{p_id}")
                 ])
-        keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan")])
+        keyboard_buttons.append([InlineKeyboardButton(text="➕ Создать новый план", callback_data="create_new_plan"), InlineKeyboardButton(text="📚 Шаблоны", callback_data="show_templates")])
         plans_keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-        await callback.message.edit_text("Ваши планы тренировок:", reply_markup=plans_keyboard)
+        await edit_view(callback.message, make_view("Ваши планы тренировок:", reply_markup=plans_keyboard))
         await callback.answer()
         return
 
@@ -727,11 +958,7 @@ async def handle_edit_plan_action(callback: types.CallbackQuery, state: FSMConte
         await callback.message.edit_text("Выберите группу мышц, чтобы добавить упражнение:", reply_markup=muscle_group_keyboard)
         await state.set_state(PlanCreationStates.waiting_for_muscle_group)
     elif action == 'remove':
-        conn = sqlite3.connect('fitness_bot.db')
-        cur = conn.cursor()
-        cur.execute("SELECT E.exercise_id, E.name FROM WorkoutPlanExercises WPE JOIN Exercises E ON WPE.exercise_id = E.exercise_id WHERE WPE.plan_id = ?", (plan_id,))
-        exercises_in_plan = cur.fetchall()
-        conn.close()
+        exercises_in_plan = await db_read(get_plan_exercises, callback.from_user.id, plan_id)
 
         if not exercises_in_plan:
             await callback.message.edit_text("В этом плане нет упражнений для удаления.", reply_markup=get_edit_plan_menu_keyboard(plan_id))
@@ -747,6 +974,23 @@ async def handle_edit_plan_action(callback: types.CallbackQuery, state: FSMConte
         remove_keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
         await callback.message.edit_text("Выберите упражнение для удаления:", reply_markup=remove_keyboard)
         await state.set_state(PlanEditingStates.removing_exercise)
+    elif action == 'share':
+        template_id = await db_write(publish_workout_plan, callback.from_user.id, plan_id)
+        if template_id:
+            bot_user = await callback.bot.me()
+            await callback.message.edit_text(
+                f"План опубликован как шаблон. Поделитесь ссылкой: https://t.me/{bot_user.username}?start=tpl_{template_id}",
+                reply_markup=get_edit_plan_menu_keyboard(plan_id))
+        else:
+            await callback.message.edit_text("Не удалось опубликовать план.", reply_markup=get_edit_plan_menu_keyboard(plan_id))
+        await state.set_state(PlanEditingStates.waiting_for_edit_action)
+    elif action == 'remind':
+        reminder = await db_read(get_plan_reminder, callback.from_user.id, plan_id)
+        current = f"Текущее напоминание: {format_reminder_schedule(reminder[1], reminder[2])}.\n\n" if reminder else ""
+        await callback.message.edit_text(
+            f"{current}Введите дни и время напоминания, например: Пн/Ср/Пт 18:00. Чтобы отключить напоминание, отправьте 'выкл'.\n"
+            f"Время указывается по часам сервера, сейчас на сервере {datetime.now():%H:%M}.")
+        await state.set_state(PlanEditingStates.setting_reminder)
 
     await callback.answer()
 
@@ -756,7 +1000,7 @@ async def process_plan_rename(message: types.Message, state: FSMContext):
         await message.answer("Название не может быть пустым. Введите другое:")
         return
     
-    if workout_plan_exists(message.from_user.id, new_name):
+    if await db_read(workout_plan_exists, message.from_user.id, new_name):
         await message.answer("План с таким названием уже существует. Пожалуйста, введите другое название:")
         return
 
@@ -764,7 +1008,7 @@ async def process_plan_rename(message: types.Message, state: FSMContext):
     plan_id = data.get('current_plan_id')
     
     if plan_id:
-        update_plan_name(plan_id, new_name)
+        await db_write(update_plan_name, message.from_user.id, plan_id, new_name, user_id=message.from_user.id)
         await message.answer(f"План переименован в '{new_name}'.")
         await state.clear()
         await cmd_plan(message, state)
@@ -772,12 +1016,47 @@ async def process_plan_rename(message: types.Message, state: FSMContext):
         await message.answer("Произошла ошибка. Попробуйте снова.")
         await state.clear()
 
+async def process_plan_reminder(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    plan_id = data.get('current_plan_id')
+    if not plan_id:
+        await message.answer("Произошла ошибка. Попробуйте снова.")
+        await state.clear()
+        return
+
+    if not message.text:
+        await message.answer("Введите дни и время текстом, например: Пн/Ср/Пт 18:00.")
+        return
+
+    if message.text.strip().lower() in ["выкл", "off"]:
+        await db_write(delete_plan_reminder, message.from_user.id, plan_id, user_id=message.from_user.id)
+        await message.answer("Напоминание отключено.", reply_markup=get_edit_plan_menu_keyboard(plan_id))
+        await state.set_state(PlanEditingStates.waiting_for_edit_action)
+        return
+
+    try:
+        weekdays, minute_of_day = parse_reminder_schedule(message.text)
+    except ValueError:
+        await message.answer("Не удалось разобрать расписание. Введите дни и время, например: Пн/Ср/Пт 18:00.")
+        return
+
+    next_fire_at = int(next_reminder_time(weekdays, minute_of_day, datetime.now()).timestamp())
+    reminder_id = await db_write(set_plan_reminder, message.from_user.id, plan_id, weekdays, minute_of_day, next_fire_at, user_id=message.from_user.id)
+    if reminder_id is None:
+        await message.answer("План не найден.")
+        await state.clear()
+        return
+    reminder_scheduler.schedule(shard_for_user(message.from_user.id), reminder_id, next_fire_at)
+
+    await message.answer(f"Напоминание установлено: {format_reminder_schedule(weekdays, minute_of_day)} (время сервера).", reply_markup=get_edit_plan_menu_keyboard(plan_id))
+    await state.set_state(PlanEditingStates.waiting_for_edit_action)
+
 async def handle_remove_exercise_from_plan(callback: types.CallbackQuery, state: FSMContext):
     parts = callback.data.split('_')
     plan_id = int(parts[4])
     exercise_id = int(parts[5])
 
-    remove_exercise_from_plan(plan_id, exercise_id)
+    await db_write(remove_exercise_from_plan, callback.from_user.id, plan_id, exercise_id, user_id=callback.from_user.id)
     
     await callback.message.edit_text("Упражнение удалено из плана.", reply_markup=get_edit_plan_menu_keyboard(plan_id))
     await state.set_state(PlanEditingStates.waiting_for_edit_action)
@@ -786,8 +1065,7 @@ async def handle_remove_exercise_from_plan(callback: types.CallbackQuery, state:
 async def handle_edit_field_selection(callback: types.CallbackQuery, state: FSMContext):
     if callback.data == 'back_to_profile':
         await state.clear()
-        await callback.message.delete()
-        await cmd_profile(callback.message, state)
+        await edit_view(callback.message, await get_profile_view(callback.from_user.id))
         await callback.answer()
         return
 
@@ -1,22 +1,70 @@
 import asyncio
 import logging
+import time
 from aiogram import Bot, Dispatcher
 
-from config import API_TOKEN
-from database import init_db
+from bot_session import TunedAiohttpSession
+from concurrency import UpdateSerializationMiddleware
+from config import API_TOKEN, OUTBOUND_STATS_INTERVAL, FSM_STATS_INTERVAL, WARM_ACTIVE_USER_DAYS, WARM_PAGE_CACHE_MAX_BYTES
+from database import init_schema, sync_catalog, sync_plan_templates, backfill_personal_records, warm_catalog, warm_user_cache, warm_page_cache, get_plan_templates, close_connections
+from digest import run_weekly_digest
 from handlers import register_handlers
+from maintenance import run_periodic_maintenance, run_periodic_vacuum
+from outbound import OutboundMiddleware, outbound_scheduler, report_stats
+from profiling import live_profiler, install_signal_handler
+from reminders import reminder_scheduler
+from render import message_tracker
+from storage import BoundedMemoryStorage, report_storage_stats
+
+async def warm_start():
+    stages = [
+        ("schema", init_schema),
+        ("catalog_sync", sync_catalog),
+        ("plan_templates", sync_plan_templates),
+        ("personal_records", backfill_personal_records),
+        ("page_cache", lambda: warm_page_cache(WARM_PAGE_CACHE_MAX_BYTES)),
+        ("catalog_index", warm_catalog),
+        ("template_list", lambda: len(get_plan_templates())),
+        ("user_profiles", lambda: warm_user_cache(WARM_ACTIVE_USER_DAYS)),
+    ]
+    timings = []
+    started = time.perf_counter()
+    for name, stage in stages:
+        stage_started = time.perf_counter()
+        result = await asyncio.to_thread(stage)
+        timings.append(f"{name}={(time.perf_counter() - stage_started) * 1000:.1f}ms ({result})")
+    logging.info(f"Старт завершен за {(time.perf_counter() - started) * 1000:.1f}ms: " + ", ".join(timings))
 
 async def main():
     logging.basicConfig(level=logging.INFO)
 
-    bot = Bot(token=API_TOKEN)
-    dp = Dispatcher()
+    bot = Bot(token=API_TOKEN, session=TunedAiohttpSession())
+    bot.session.middleware(OutboundMiddleware(outbound_scheduler))
+    bot.session.middleware(message_tracker)
+    storage = BoundedMemoryStorage()
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateSerializationMiddleware())
 
     register_handlers(dp)
+    live_profiler.attach(dp)
+    install_signal_handler()
 
-    init_db()
+    await warm_start()
 
-    await dp.start_polling(bot)
+    background_tasks = [
+        asyncio.create_task(report_stats(OUTBOUND_STATS_INTERVAL)),
+        asyncio.create_task(report_storage_stats(storage, FSM_STATS_INTERVAL)),
+        asyncio.create_task(reminder_scheduler.run(bot)),
+        asyncio.create_task(run_periodic_maintenance()),
+        asyncio.create_task(run_periodic_vacuum()),
+        asyncio.create_task(run_weekly_digest(bot)),
+    ]
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        close_connections()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
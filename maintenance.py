@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import time
+
+from config import (
+    ARCHIVE_HORIZON_DAYS, MAINTENANCE_INTERVAL,
+    VACUUM_INTERVAL, VACUUM_SLICE_PAGES, VACUUM_SLICE_PAUSE, SHARD_COUNT)
+from database import archive_progress_logs, reclaim_free_pages_slice, db_write
+
+
+def run_maintenance():
+    started = time.perf_counter()
+    archived = archive_progress_logs(ARCHIVE_HORIZON_DAYS)
+    logging.info(
+        f"Обслуживание базы: перенесено в архив {archived} записей "
+        f"за {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+async def run_periodic_maintenance(interval=MAINTENANCE_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except Exception:
+            logging.exception("Ошибка при обслуживании базы")
+
+
+async def vacuum_free_pages(slice_pages=VACUUM_SLICE_PAGES, pause=VACUUM_SLICE_PAUSE):
+    """
+    Возвращает ОС свободные страницы всех шардов порциями по slice_pages: каждая порция занимает
+    писателя шарда ненадолго, между порциями запросы пользователей успевают выполнить свои записи.
+    :return: Кортеж (освобождено страниц, время самой долгой порции в секундах)
+    """
+    reclaimed = 0
+    slowest = 0.0
+    for shard in range(SHARD_COUNT):
+        while True:
+            started = time.perf_counter()
+            freed, remaining = await db_write(reclaim_free_pages_slice, shard, slice_pages, shard=shard)
+            slowest = max(slowest, time.perf_counter() - started)
+            reclaimed += freed
+            if not freed or not remaining:
+                break
+            await asyncio.sleep(pause)
+    return reclaimed, slowest
+
+
+async def run_periodic_vacuum(interval=VACUUM_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reclaimed, slowest = await vacuum_free_pages()
+            if reclaimed:
+                logging.info(f"Освобождено {reclaimed} страниц, самая долгая порция {slowest * 1000:.1f}ms")
+        except Exception:
+            logging.exception("Ошибка при освобождении страниц")
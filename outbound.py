@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES)
+
+INTERACTIVE = 0
+BULK = 1
+
+_priority = ContextVar('outbound_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_sending():
+    """
+    Помечает все запросы к Bot API внутри блока как массовую рассылку (низкий приоритет).
+    """
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, now):
+        """
+        Забирает токен, при необходимости в долг, и возвращает время ожидания в секундах.
+        """
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def defer(self, seconds, now):
+        """
+        Откладывает следующий токен минимум на seconds секунд (долг в токенах, как у reserve).
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, 1) - seconds * self.rate
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundScheduler:
+    def __init__(self, global_rate=OUTBOUND_GLOBAL_RATE, global_burst=OUTBOUND_GLOBAL_BURST,
+                 chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST):
+        self._global_rate = global_rate
+        self._global_burst = global_burst
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._global = None
+        self._chats = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._task = None
+        self._stats = {
+            priority: {'sent': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+            for priority in (INTERACTIVE, BULK)
+        }
+        self._retries = 0
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst, now)
+        return bucket
+
+    async def acquire(self, chat_id, priority=INTERACTIVE):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if self._global is None:
+            self._global = TokenBucket(self._global_rate, self._global_burst, started)
+
+        delay = self._chat_bucket(chat_id, started).reserve(started)
+        if delay:
+            await asyncio.sleep(delay)
+
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        await future
+
+        waited = loop.time() - started
+        stats = self._stats[priority]
+        stats['sent'] += 1
+        stats['wait_total'] += waited
+        stats['wait_max'] = max(stats['wait_max'], waited)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            now = loop.time()
+            wait = max(self._paused_until - now, self._global.delay(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._global.reserve(now)
+            future.set_result(None)
+
+    def pause(self, seconds, chat_id=None):
+        """
+        Реакция на 429 от Bot API. Если запрос был в конкретный чат, ждет только этот чат,
+        иначе приостанавливается вся очередь.
+        """
+        now = asyncio.get_running_loop().time()
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, now + seconds)
+        else:
+            self._chat_bucket(chat_id, now).defer(seconds, now)
+        self._retries += 1
+
+    def stats(self):
+        depth = {INTERACTIVE: 0, BULK: 0}
+        for priority, _, future in self._queue:
+            if not future.done():
+                depth[priority] += 1
+        result = {'retry_after': self._retries, 'chats_tracked': len(self._chats)}
+        for priority, name in ((INTERACTIVE, 'interactive'), (BULK, 'bulk')):
+            stats = self._stats[priority]
+            result[name] = {
+                'queue_depth': depth[priority],
+                'sent': stats['sent'],
+                'wait_avg_ms': round(stats['wait_total'] / stats['sent'] * 1000, 1) if stats['sent'] else 0.0,
+                'wait_max_ms': round(stats['wait_max'] * 1000, 1),
+            }
+        return result
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                logging.warning(f"Bot API попросил подождать {e.retry_after} с ({type(method).__name__}), очередь приостановлена")
+                self.scheduler.pause(e.retry_after)
+                raise
+
+        priority = _priority.get()
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            await self.scheduler.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                logging.warning(f"Bot API попросил подождать {e.retry_after} с ({type(method).__name__}, чат {chat_id})")
+                self.scheduler.pause(e.retry_after, chat_id)
+
+
+outbound_scheduler = OutboundScheduler()
+
+
+async def report_stats(interval):
+    while True:
+        await asyncio.sleep(interval)
+        logging.info(f"Очередь отправки: {outbound_scheduler.stats()}")
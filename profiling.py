@@ -0,0 +1,196 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+
+from aiogram import BaseMiddleware
+
+from config import PROFILE_DIR, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS, PROFILE_TOP_N, PROFILE_TRACEMALLOC_FRAMES
+
+
+def dump_tasks(file):
+    """
+    Пишет в file все задачи asyncio со стеками, в которых они сейчас ожидают.
+    """
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    file.write(f"Задач: {len(tasks)}\n\n")
+    for task in tasks:
+        coro = task.get_coro()
+        file.write(f"=== {task.get_name()}: {getattr(coro, '__qualname__', coro)}\n")
+        task.print_stack(file=file)
+        file.write("\n")
+
+
+class _HandlerScope(BaseMiddleware):
+    """
+    Включает профайлер только пока выполняется хотя бы один из выбранных хендлеров
+    и собирает по ним число вызовов, суммарное и максимальное время.
+    Остальные задачи цикла, работающие в это же время, тоже попадают в профиль.
+    """
+
+    def __init__(self, profile, handlers):
+        self.profile = profile
+        self.handlers = handlers
+        self.calls = {}
+        self._in_flight = 0
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        if name not in self.handlers:
+            return await handler(event, data)
+        if not self._in_flight:
+            self.profile.enable()
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_flight -= 1
+            if not self._in_flight:
+                self.profile.disable()
+            stats = self.calls.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+
+class LiveProfiler:
+    """
+    Профилирование работающего бота по запросу: cProfile цикла событий, снимки tracemalloc
+    и дампы задач asyncio за заданное число секунд. Пока сессия не запущена,
+    ничего не включено и middleware не зарегистрировано.
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self._observers = ()
+        self._task = None
+
+    def attach(self, dp):
+        self._observers = (dp.message, dp.callback_query, dp.inline_query)
+
+    @property
+    def active(self):
+        return self._task is not None and not self._task.done()
+
+    def handler_names(self):
+        return {handler.callback.__name__ for observer in self._observers for handler in observer.handlers}
+
+    def start(self, seconds=PROFILE_DEFAULT_SECONDS, handlers=(), on_finish=None):
+        """
+        Запускает сессию профилирования в фоне.
+        :param handlers: Имена хендлеров из register_handlers; если пусто - профилируется весь цикл событий
+        :param on_finish: Корутинная функция, получающая список записанных файлов
+        """
+        if self.active:
+            raise RuntimeError("Профилирование уже запущено")
+        unknown = set(handlers) - self.handler_names()
+        if unknown:
+            raise ValueError(f"Неизвестные хендлеры: {', '.join(sorted(unknown))}")
+        seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+        self._task = asyncio.create_task(self._run(seconds, frozenset(handlers), on_finish), name='live-profiler')
+        return self._task
+
+    async def _run(self, seconds, handlers, on_finish):
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, time.strftime('profile-%Y%m%d-%H%M%S'))
+        files = []
+        tasks_before = io.StringIO()
+        dump_tasks(tasks_before)
+
+        profile = cProfile.Profile()
+        scope = _HandlerScope(profile, handlers) if handlers else None
+        tracemalloc_started = not tracemalloc.is_tracing()
+        if tracemalloc_started:
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        memory_before = tracemalloc.take_snapshot()
+        if scope:
+            for observer in self._observers:
+                observer.middleware(scope)
+        else:
+            profile.enable()
+        logging.info(f"Профилирование запущено на {seconds} с"
+                     + (f" для хендлеров: {', '.join(sorted(handlers))}" if handlers else ""))
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            if scope:
+                for observer in self._observers:
+                    observer.middleware.unregister(scope)
+            memory_after = tracemalloc.take_snapshot()
+            if tracemalloc_started:
+                tracemalloc.stop()
+            tasks_after = io.StringIO()
+            dump_tasks(tasks_after)
+            calls = {name: tuple(stats) for name, stats in scope.calls.items()} if scope else None
+            files = await asyncio.to_thread(
+                self._write, prefix, profile, calls, memory_before, memory_after,
+                tasks_before.getvalue(), tasks_after.getvalue())
+            logging.info(f"Профилирование завершено, файлы: {', '.join(files)}")
+
+        if on_finish:
+            try:
+                await on_finish(files)
+            except Exception as e:
+                logging.warning(f"Не удалось сообщить о результатах профилирования: {e}")
+        return files
+
+    def _write(self, prefix, profile, calls, memory_before, memory_after, tasks_before, tasks_after):
+        files = []
+
+        profile.dump_stats(f"{prefix}.prof")
+        files.append(f"{prefix}.prof")
+        with open(f"{prefix}-cpu.txt", 'w', encoding='utf-8') as f:
+            if calls is not None:
+                f.write("Хендлер: вызовов, всего с, макс с\n")
+                for name, (count, total, longest) in sorted(calls.items(), key=lambda item: -item[1][1]):
+                    f.write(f"{name}: {count}, {total:.3f}, {longest:.3f}\n")
+                f.write("\n")
+            try:
+                pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+            except TypeError:
+                f.write("Профиль пуст: за время сессии выбранные хендлеры не вызывались\n")
+        files.append(f"{prefix}-cpu.txt")
+
+        with open(f"{prefix}-memory.txt", 'w', encoding='utf-8') as f:
+            f.write("Прирост памяти за сессию:\n")
+            for stat in memory_after.compare_to(memory_before, 'lineno')[:PROFILE_TOP_N]:
+                f.write(f"{stat}\n")
+            f.write("\nКрупнейшие выделения в конце сессии:\n")
+            for stat in memory_after.statistics('lineno')[:PROFILE_TOP_N]:
+                f.write(f"{stat}\n")
+        files.append(f"{prefix}-memory.txt")
+
+        with open(f"{prefix}-tasks.txt", 'w', encoding='utf-8') as f:
+            f.write("--- Начало сессии ---\n")
+            f.write(tasks_before)
+            f.write("--- Конец сессии ---\n")
+            f.write(tasks_after)
+        files.append(f"{prefix}-tasks.txt")
+        return files
+
+
+live_profiler = LiveProfiler()
+
+
+def install_signal_handler(seconds=PROFILE_DEFAULT_SECONDS):
+    """
+    По SIGUSR1 запускает профилирование всего цикла событий на seconds секунд.
+    """
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+
+    def on_signal():
+        try:
+            live_profiler.start(seconds)
+        except RuntimeError as e:
+            logging.warning(f"SIGUSR1 проигнорирован: {e}")
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, on_signal)
@@ -0,0 +1,17 @@
+import argparse
+
+from config import SHARD_COUNT
+from database import rebalance_shards, close_connections
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Переносит пользователей между шардами после изменения SHARD_COUNT в config.py. "
+                    "Запускать при остановленном боте.")
+    parser.add_argument('--from-shards', type=int, required=True, help="количество шардов до изменения")
+    args = parser.parse_args()
+    try:
+        moved = rebalance_shards(args.from_shards)
+    finally:
+        close_connections()
+    print(f"Перенесено пользователей: {moved} ({args.from_shards} -> {SHARD_COUNT} шардов)")
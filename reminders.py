@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+
+from config import (
+    REMINDER_LOOKAHEAD, REMINDER_BATCH_SIZE,
+    REMINDER_MISSED_GRACE, REMINDER_MAX_SLEEP, SHARD_COUNT)
+from database import get_reminders_page, get_reminders_by_ids, reschedule_reminders, db_read, db_write
+from outbound import bulk_sending
+from tools import next_reminder_time
+
+
+class ReminderScheduler:
+    """
+    Планировщик напоминаний: в памяти держится только куча ближайших срабатываний
+    в окне REMINDER_LOOKAHEAD секунд, остальное догружается из таблиц reminders всех шардов по мере движения окна.
+    Элемент кучи - (время срабатывания, шард, reminder_id): reminder_id уникален только внутри шарда.
+    """
+
+    def __init__(self, lookahead=REMINDER_LOOKAHEAD, batch_size=REMINDER_BATCH_SIZE):
+        self.lookahead = lookahead
+        self.batch_size = batch_size
+        self._heap = []
+        self._loaded_until = None
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, shard, reminder_id, next_fire_at):
+        """
+        Сообщает планировщику о новом или измененном напоминании.
+        """
+        if self._loaded_until is not None and next_fire_at < self._loaded_until:
+            heapq.heappush(self._heap, (next_fire_at, shard, reminder_id))
+            self._wakeup.set()
+
+    async def _load_window(self, now):
+        fire_from = 0 if self._loaded_until is None else self._loaded_until
+        fire_until = now + self.lookahead
+        for shard in range(SHARD_COUNT):
+            cursor = (0, 0)
+            while True:
+                page = await db_read(get_reminders_page, shard, fire_from, fire_until, cursor, self.batch_size)
+                for reminder_id, next_fire_at in page:
+                    heapq.heappush(self._heap, (next_fire_at, shard, reminder_id))
+                if len(page) < self.batch_size:
+                    break
+                cursor = (page[-1][1], page[-1][0])
+        # Окно сдвигается только после полной загрузки: при ошибке оно загрузится заново, дубли в куче безвредны
+        self._loaded_until = fire_until
+
+    def _requeue(self, shard, due):
+        for reminder_id, next_fire_at in due.items():
+            heapq.heappush(self._heap, (next_fire_at, shard, reminder_id))
+
+    def _pop_due(self, now):
+        due = {}
+        count = 0
+        while self._heap and self._heap[0][0] <= now and count < self.batch_size:
+            next_fire_at, shard, reminder_id = heapq.heappop(self._heap)
+            due.setdefault(shard, {})[reminder_id] = next_fire_at
+            count += 1
+        return due
+
+    async def _fire(self, bot, shard, due, now):
+        rows = await db_read(get_reminders_by_ids, shard, list(due))
+        updates = []
+        sends = []
+        for reminder_id, user_id, plan_id, weekdays, minute_of_day, next_fire_at, plan_name in rows:
+            if next_fire_at != due[reminder_id]:
+                continue
+            if now - next_fire_at <= REMINDER_MISSED_GRACE:
+                sends.append(self._send(bot, user_id, plan_name))
+            new_fire_at = int(next_reminder_time(weekdays, minute_of_day, datetime.fromtimestamp(now)).timestamp())
+            updates.append((new_fire_at, reminder_id, next_fire_at))
+
+        with bulk_sending():
+            await asyncio.gather(*sends)
+        await db_write(reschedule_reminders, shard, updates, shard=shard)
+        for new_fire_at, reminder_id, _ in updates:
+            self.schedule(shard, reminder_id, new_fire_at)
+
+    async def _send(self, bot, user_id, plan_name):
+        try:
+            await bot.send_message(user_id, f"⏰ Пора на тренировку! Сегодня по плану: {plan_name}")
+        except Exception as e:
+            logging.warning(f"Не удалось отправить напоминание пользователю {user_id}: {e}")
+
+    async def _tick(self, bot):
+        now = int(time.time())
+        if self._loaded_until is None or self._loaded_until - now < self.lookahead / 2:
+            await self._load_window(now)
+
+        due = self._pop_due(now)
+        if due:
+            pending = list(due.items())
+            for index, (shard, shard_due) in enumerate(pending):
+                try:
+                    await self._fire(bot, shard, shard_due, now)
+                except Exception:
+                    # Возвращаем в кучу и этот шард, и неотработанные: при повторе напоминание,
+                    # отправленное до сбоя записи, может прийти второй раз, но не потеряется
+                    for failed_shard, failed_due in pending[index:]:
+                        self._requeue(failed_shard, failed_due)
+                    raise
+            return
+
+        sleep_for = REMINDER_MAX_SLEEP
+        if self._heap:
+            sleep_for = min(sleep_for, max(0, self._heap[0][0] - now))
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, bot):
+        backoff = 1
+        while True:
+            try:
+                await self._tick(bot)
+                backoff = 1
+            except Exception:
+                logging.exception(f"Ошибка в планировщике напоминаний, повтор через {backoff} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, REMINDER_MAX_SLEEP)
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,143 @@
+import hashlib
+import logging
+from collections import OrderedDict, namedtuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import DeleteMessage, EditMessageReplyMarkup, EditMessageText, SendMessage
+from aiogram.types import Message
+
+from config import RENDER_CACHE_SIZE, RENDER_TRACKED_MESSAGES
+
+View = namedtuple('View', ('text', 'reply_markup', 'parse_mode', 'digest'))
+
+
+def content_digest(text, reply_markup=None, parse_mode=None):
+    """
+    Хеш содержимого сообщения: текст, режим разметки и клавиатура.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(text.encode('utf-8'))
+    digest.update(b'\0')
+    if isinstance(parse_mode, str):
+        digest.update(parse_mode.encode('utf-8'))
+    digest.update(b'\0')
+    if reply_markup is not None:
+        digest.update(reply_markup.model_dump_json(exclude_none=True).encode('utf-8'))
+    return digest.digest()
+
+
+def make_view(text, reply_markup=None, parse_mode=None):
+    return View(text, reply_markup, parse_mode, content_digest(text, reply_markup, parse_mode))
+
+
+class _BoundedDict:
+    __slots__ = ('maxsize', '_items')
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key):
+        self._items.pop(key, None)
+
+
+class RenderCache:
+    """
+    Кеш готовых экранов (View). Ключ включает версию содержимого, например
+    ('plan', user_id, plan_id, версия плана), поэтому явная инвалидация не нужна:
+    после изменения данных экран просто строится под новым ключом, а старый вытесняется по LRU.
+    """
+
+    def __init__(self, maxsize=RENDER_CACHE_SIZE):
+        self._views = _BoundedDict(maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_render(self, key, render):
+        """
+        :param render: Корутинная функция без аргументов, возвращающая View или None (None не кешируется)
+        """
+        view = self._views.get(key)
+        if view is not None:
+            self.hits += 1
+            return view
+        self.misses += 1
+        view = await render()
+        if view is not None:
+            self._views.put(key, view)
+        return view
+
+    def stats(self):
+        return {'views': len(self._views), 'hits': self.hits, 'misses': self.misses}
+
+
+class MessageTracker(BaseRequestMiddleware):
+    """
+    Запоминает хеш содержимого последних отправленных и отредактированных ботом сообщений,
+    чтобы edit_view мог пропускать правки, которые ничего не меняют.
+    Учитываются все запросы к Bot API, а не только сделанные через edit_view.
+    """
+
+    def __init__(self, maxsize=RENDER_TRACKED_MESSAGES):
+        self._digests = _BoundedDict(maxsize)
+        self.skipped = 0
+
+    def is_shown(self, message, digest):
+        return self._digests.get((message.chat.id, message.message_id)) == digest
+
+    def remember(self, message, digest):
+        self._digests.put((message.chat.id, message.message_id), digest)
+
+    async def __call__(self, make_request, bot, method):
+        result = await make_request(bot, method)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            if isinstance(result, Message):
+                self._digests.put(
+                    (result.chat.id, result.message_id),
+                    content_digest(method.text, method.reply_markup, method.parse_mode))
+        elif isinstance(method, (EditMessageReplyMarkup, DeleteMessage)):
+            self._digests.pop((method.chat_id, method.message_id))
+        return result
+
+
+render_cache = RenderCache()
+message_tracker = MessageTracker()
+
+
+async def edit_view(message, view):
+    """
+    Редактирует сообщение, только если его содержимое отличается от view.
+    :return: True, если сообщение было изменено
+    """
+    if message_tracker.is_shown(message, view.digest):
+        message_tracker.skipped += 1
+        return False
+    try:
+        await message.edit_text(view.text, reply_markup=view.reply_markup, parse_mode=view.parse_mode)
+    except TelegramBadRequest as e:
+        if 'message is not modified' not in str(e):
+            raise
+        logging.debug(f"Сообщение {message.message_id} не изменилось")
+        message_tracker.remember(message, view.digest)
+        return False
+    return True
+
+
+async def send_view(message, view):
+    return await message.answer(view.text, reply_markup=view.reply_markup, parse_mode=view.parse_mode)
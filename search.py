@@ -0,0 +1,81 @@
+import re
+from functools import lru_cache
+
+from config import SEARCH_CACHE_SIZE, SEARCH_RESULTS_LIMIT, SEARCH_FUZZY_THRESHOLD
+from database import get_all_exercises, get_catalog_entry, get_catalog_version, search_exercises_fts
+
+_word_re = re.compile(r"\w+")
+_trigram_index = (None, {}, {})
+
+
+def _normalize(text):
+    return " ".join(_word_re.findall(text.lower().replace("ё", "е")))
+
+
+def _trigrams(text):
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _get_trigram_index(version):
+    global _trigram_index
+    if _trigram_index[0] != version:
+        index = {}
+        sizes = {}
+        for exercise_id, _ in get_all_exercises():
+            name, muscle_group, _, _ = get_catalog_entry(exercise_id)
+            grams = _trigrams(_normalize(f"{name} {muscle_group}"))
+            sizes[exercise_id] = len(grams)
+            for gram in grams:
+                index.setdefault(gram, set()).add(exercise_id)
+        _trigram_index = (version, index, sizes)
+    return _trigram_index[1], _trigram_index[2]
+
+
+def _fuzzy_search(version, query, limit):
+    index, sizes = _get_trigram_index(version)
+    query_grams = _trigrams(query)
+    if not query_grams:
+        return []
+    hits = {}
+    for gram in query_grams:
+        for exercise_id in index.get(gram, ()):
+            hits[exercise_id] = hits.get(exercise_id, 0) + 1
+    scored = [
+        (common / len(query_grams), exercise_id)
+        for exercise_id, common in hits.items()
+        if common / len(query_grams) >= SEARCH_FUZZY_THRESHOLD
+    ]
+    scored.sort(key=lambda item: (-item[0], sizes[item[1]]))
+    return [exercise_id for _, exercise_id in scored[:limit]]
+
+
+@lru_cache(maxsize=SEARCH_CACHE_SIZE)
+def _search(version, query, limit):
+    match_expression = " ".join(f'"{word}"*' for word in query.split())
+    found = search_exercises_fts(match_expression, limit)
+    if len(found) < limit:
+        for exercise_id in _fuzzy_search(version, query, limit):
+            if exercise_id not in found:
+                found.append(exercise_id)
+    return tuple(found[:limit])
+
+
+def search_exercises(query, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Ищет упражнения по названию и группе мышц: сначала префиксный поиск FTS5,
+    затем нечеткий поиск по триграммам для запросов с опечатками.
+    :return: Список кортежей (exercise_id, название, группа_мышц, подходы, повторения)
+    """
+    normalized = _normalize(query)
+    if not normalized:
+        return []
+    results = []
+    for exercise_id in _search(get_catalog_version(), normalized, limit):
+        entry = get_catalog_entry(exercise_id)
+        if entry:
+            results.append((exercise_id, *entry))
+    return results
@@ -0,0 +1,115 @@
+import json
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from logging.handlers import RotatingFileHandler
+
+from config import (
+    SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG,
+    SLOW_QUERY_LOG_MAX_BYTES, SLOW_QUERY_LOG_BACKUPS)
+
+_logger = logging.getLogger('slow_queries')
+_logger.propagate = False
+_explain_cache = {}
+
+_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_placeholder_list_re = re.compile(r"\?(?:\s*,\s*\?)+")
+_whitespace_re = re.compile(r"\s+")
+
+
+def normalize_sql(query):
+    """
+    Приводит запрос к шаблону: схлопывает пробелы, заменяет литералы и списки плейсхолдеров.
+    """
+    template = _whitespace_re.sub(' ', query).strip()
+    template = _literal_re.sub('?', template)
+    return _placeholder_list_re.sub('?...', template)
+
+
+def params_shape(params):
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    shape = [type(value).__name__ for value in params[:16]]
+    if len(params) > 16:
+        shape.append(f"...+{len(params) - 16}")
+    return shape
+
+
+def _ensure_handler():
+    if _logger.handlers:
+        return
+    handler = RotatingFileHandler(
+        SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+        backupCount=SLOW_QUERY_LOG_BACKUPS, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    _logger.addHandler(handler)
+    _logger.setLevel(logging.INFO)
+
+
+def _explain(conn, template, query, params):
+    if template not in _explain_cache:
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            _explain_cache[template] = [row[-1] for row in rows]
+        except Exception as e:
+            _explain_cache[template] = [f"explain failed: {e}"]
+    return _explain_cache[template]
+
+
+def record_query(conn, query, params, duration, many=False):
+    """
+    Пишет запрос в журнал медленных запросов, если он выполнялся дольше порога.
+    :param duration: Время выполнения в секундах
+    """
+    if SLOW_QUERY_THRESHOLD_MS is None or duration * 1000 < SLOW_QUERY_THRESHOLD_MS:
+        return
+    template = normalize_sql(query)
+    if many:
+        params = params[0] if params else ()
+    _ensure_handler()
+    _logger.info(json.dumps({
+        'ts': round(time.time(), 3),
+        'template': template,
+        'params': params_shape(params),
+        'many': many,
+        'duration_ms': round(duration * 1000, 3),
+        'plan': _explain(conn, template, query, params),
+    }, ensure_ascii=False))
+
+
+def summarize(paths, top=20):
+    stats = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'durations': [], 'plan': []})
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    item = stats[entry['template']]
+                    item['count'] += 1
+                    item['total_ms'] += entry['duration_ms']
+                    item['max_ms'] = max(item['max_ms'], entry['duration_ms'])
+                    item['durations'].append(entry['duration_ms'])
+                    item['plan'] = entry.get('plan', item['plan'])
+        except FileNotFoundError:
+            continue
+
+    ranked = sorted(stats.items(), key=lambda kv: kv[1]['total_ms'], reverse=True)[:top]
+    for position, (template, item) in enumerate(ranked, 1):
+        durations = sorted(item['durations'])
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        print(f"#{position} total={item['total_ms']:.1f}ms count={item['count']} "
+              f"p95={p95:.1f}ms max={item['max_ms']:.1f}ms")
+        print(f"    {template}")
+        for detail in item['plan']:
+            print(f"    plan: {detail}")
+    return ranked
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or [SLOW_QUERY_LOG] + [f"{SLOW_QUERY_LOG}.{i}" for i in range(1, SLOW_QUERY_LOG_BACKUPS + 1)]
+    summarize(paths)
@@ -12,6 +12,7 @@ class PlanCreationStates(StatesGroup):
     waiting_for_plan_name = State()
     waiting_for_plan_muscle_group = State()
     waiting_for_muscle_group = State()
+    waiting_for_exercise_search = State()
     waiting_for_exercise_selection = State()
     waiting_for_add_more_exercises = State()
 
@@ -28,6 +29,7 @@ class PlanEditingStates(StatesGroup):
     waiting_for_edit_action = State()
     renaming_plan = State()
     removing_exercise = State()
+    setting_reminder = State()
 
 class ProfileEditingStates(StatesGroup):
     editing_weight = State()
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from config import FSM_MAX_ENTRIES, FSM_DEFAULT_TTL, FSM_STATE_TTL
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'expires_at', 'size')
+
+    def __init__(self):
+        self.state = None
+        self.data = {}
+        self.expires_at = 0.0
+        self.size = 0
+
+
+def _estimate_size(value, depth=0):
+    size = sys.getsizeof(value)
+    if depth < 3:
+        if isinstance(value, dict):
+            size += sum(_estimate_size(k, depth + 1) + _estimate_size(v, depth + 1) for k, v in value.items())
+        elif isinstance(value, (list, tuple, set)):
+            size += sum(_estimate_size(item, depth + 1) for item in value)
+    return size
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    FSM-хранилище в памяти с ограничением по числу записей (вытеснение LRU) и временем жизни,
+    зависящим от группы состояний (FSM_STATE_TTL). Брошенные диалоги удаляются по истечении TTL.
+    """
+
+    def __init__(self, max_entries=FSM_MAX_ENTRIES, default_ttl=FSM_DEFAULT_TTL, state_ttl=FSM_STATE_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.state_ttl = state_ttl
+        self._records = OrderedDict()
+        self._bytes = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def _ttl(self, state):
+        if state is None:
+            return self.default_ttl
+        return self.state_ttl.get(state.split(':', 1)[0], self.default_ttl)
+
+    def _drop(self, key):
+        record = self._records.pop(key)
+        self._bytes -= record.size
+
+    def _get(self, key):
+        record = self._records.get(key)
+        if record is None:
+            return None
+        now = time.monotonic()
+        if record.expires_at <= now:
+            self._drop(key)
+            self._expired += 1
+            return None
+        record.expires_at = now + self._ttl(record.state)
+        self._records.move_to_end(key)
+        return record
+
+    def _put(self, key, state, data):
+        record = self._get(key)
+        if state is None and not data:
+            if record is not None:
+                self._drop(key)
+            return
+        if record is None:
+            record = self._records[key] = _Record()
+        record.state = state
+        record.data = data
+        record.expires_at = time.monotonic() + self._ttl(state)
+        self._bytes -= record.size
+        record.size = _estimate_size(key) + _estimate_size(state) + _estimate_size(data) + sys.getsizeof(record)
+        self._bytes += record.size
+        self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        for _ in range(8):
+            if not self._records:
+                return
+            key, record = next(iter(self._records.items()))
+            if record.expires_at > now:
+                break
+            self._drop(key)
+            self._expired += 1
+        while len(self._records) > self.max_entries:
+            self._drop(next(iter(self._records)))
+            self._evicted += 1
+
+    def sweep(self):
+        """
+        Удаляет все записи с истекшим TTL.
+        :return: Количество удаленных записей
+        """
+        now = time.monotonic()
+        expired = [key for key, record in self._records.items() if record.expires_at <= now]
+        for key in expired:
+            self._drop(key)
+        self._expired += len(expired)
+        return len(expired)
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        record = self._get(key)
+        self._put(key, state, record.data if record else {})
+
+    async def get_state(self, key):
+        record = self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key, data):
+        record = self._get(key)
+        self._put(key, record.state if record else None, data.copy())
+
+    async def get_data(self, key):
+        record = self._get(key)
+        return record.data.copy() if record else {}
+
+    async def close(self):
+        self._records.clear()
+        self._bytes = 0
+
+    def stats(self):
+        return {
+            'states': len(self._records),
+            'bytes': self._bytes,
+            'expired': self._expired,
+            'evicted': self._evicted,
+        }
+
+
+async def report_storage_stats(storage, interval):
+    while True:
+        await asyncio.sleep(interval)
+        storage.sweep()
+        logging.info(f"FSM-хранилище: {storage.stats()}")
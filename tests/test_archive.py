@@ -0,0 +1,25 @@
+import struct
+import zlib
+
+from archive import pack_logs, unpack_logs
+
+
+def test_round_trip_keeps_reps_and_empty_values():
+    logs = [
+        (60.0, 3, '10\n11', '2024-01-01'),
+        (50.0, 3, '8', '2024-01-01'),
+        (None, None, None, '2024-01-02'),
+        (0.0, 0, '', '2024-01-03'),
+        (102.5, 5, 'до отказа', '2024-01-04'),
+    ]
+    assert unpack_logs(pack_logs(logs)) == logs
+
+
+def test_round_trip_empty_chunk():
+    assert unpack_logs(pack_logs([])) == []
+
+
+def test_reads_version_1_chunks():
+    body = (struct.pack('<BI', 1, 2) + struct.pack('<2i', 19723, 19724)
+            + struct.pack('<2d', 60.0, 0.0) + struct.pack('<2i', 3, 0) + '10\n8-12'.encode('utf-8'))
+    assert unpack_logs(zlib.compress(body)) == [(60.0, 3, '10', '2024-01-01'), (0.0, 0, '8-12', '2024-01-02')]
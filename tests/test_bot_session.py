@@ -0,0 +1,19 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiogram')
+
+from bot_session import TunedAiohttpSession
+
+
+def test_connector_gets_pool_settings():
+    async def created_connector():
+        session = TunedAiohttpSession(limit=20, limit_per_host=7, keepalive_timeout=11, dns_ttl=123)
+        try:
+            connector = (await session.create_session()).connector
+            return connector.limit, connector.limit_per_host, connector._keepalive_timeout, connector._cached_hosts._ttl
+        finally:
+            await session.close()
+
+    assert asyncio.run(created_connector()) == (20, 7, 11, 123)
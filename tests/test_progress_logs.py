@@ -0,0 +1,43 @@
+import pytest
+
+import database
+import slow_queries
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(slow_queries, 'SLOW_QUERY_THRESHOLD_MS', None)
+    monkeypatch.setattr(database, 'DB_NAME', str(tmp_path / 'test.db'))
+    database.init_schema()
+    database.sync_catalog()
+    database.add_user(1, 80, 180, 30, 'm', 't', 'a')
+    yield database
+    database.close_connections()
+
+
+def test_sql_decoding_matches_decode_log(db):
+    today = db._today()
+    rows = [
+        (8000, 3, 10, None, None, today),
+        (8250, 4, 8, 12, None, today - 1),
+        (None, None, 0, None, 'до отказа', today - 2),
+        (10050, 5, 0, None, '', today - 3),
+    ]
+    with db._writer(1) as conn:
+        conn.executemany(
+            f"INSERT INTO progress_logs (user_id, exercise_id, {db._LOG_COLUMNS}) VALUES (1, 1, ?, ?, ?, ?, ?, ?)", rows)
+
+    assert db.get_progress_logs(1, 1) == [db._decode_log(*row) for row in rows]
+
+
+def test_archived_rows_have_the_same_shape(db):
+    today = db._today()
+    with db._writer(1) as conn:
+        conn.executemany(
+            f"INSERT INTO progress_logs (user_id, exercise_id, {db._LOG_COLUMNS}) VALUES (1, 1, ?, 3, 10, NULL, NULL, ?)",
+            [(7000 + day, today - day * 30) for day in range(6)])
+    expected = db.get_progress_logs(1, 1)
+
+    assert db.archive_progress_logs(90) == 2
+    assert db.get_progress_logs(1, 1) == expected
+    assert db.get_progress_logs(1, 1, 'month') == expected[:2]
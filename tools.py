@@ -1,3 +1,13 @@
+import math
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+WEIGHT_SCALE = 100
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_reps_re = re.compile(r"(\d+)(?:-(\d+))?")
+
+
 def calculate_bmi(weight: float, height: int):
     """
     Рассчитывает индекс массы тела (ИМТ) и возвращает значение ИМТ и его категорию.
@@ -47,4 +57,142 @@ def calculate_calories(gender: str, weight: float, height: int, age: int, activi
         "Сброс веса": int(maintenance_calories * 0.85),
         "Поддержание": int(maintenance_calories),
         "Набор массы": int(maintenance_calories * 1.15)
-    }
\ No newline at end of file
+    }
+
+WEEKDAY_ALIASES = {
+    "пн": 0, "вт": 1, "ср": 2, "чт": 3, "пт": 4, "сб": 5, "вс": 6,
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6
+}
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+def parse_reminder_schedule(text: str):
+    """
+    Разбирает расписание напоминаний вида "Пн/Ср/Пт 18:00" или "Mon/Wed/Fri 18:00".
+    Если дни не указаны, напоминание срабатывает ежедневно.
+    :return: Кортеж (битовая_маска_дней, минута_дня)
+    :raises ValueError: Если расписание не удалось разобрать
+    """
+    tokens = text.lower().replace("/", " ").replace(",", " ").split()
+    if not tokens:
+        raise ValueError("Пустое расписание.")
+
+    hours, _, minutes = tokens[-1].partition(":")
+    hours, minutes = int(hours), int(minutes or 0)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError("Неверное время.")
+
+    weekdays = 0
+    for token in tokens[:-1]:
+        if token[:3] in WEEKDAY_ALIASES:
+            weekdays |= 1 << WEEKDAY_ALIASES[token[:3]]
+        elif token[:2] in WEEKDAY_ALIASES:
+            weekdays |= 1 << WEEKDAY_ALIASES[token[:2]]
+        else:
+            raise ValueError(f"Неизвестный день недели: {token}")
+
+    return weekdays or 0b1111111, hours * 60 + minutes
+
+
+def format_reminder_schedule(weekdays: int, minute_of_day: int):
+    days = "/".join(name for i, name in enumerate(WEEKDAY_NAMES) if weekdays & (1 << i))
+    return f"{days} {minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+
+def next_reminder_time(weekdays: int, minute_of_day: int, after: datetime):
+    """
+    Находит ближайший момент срабатывания напоминания строго после указанного времени.
+    :return: datetime следующего срабатывания
+    """
+    day_start = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(8):
+        candidate = day_start + timedelta(days=offset, minutes=minute_of_day)
+        if candidate > after and weekdays & (1 << candidate.weekday()):
+            return candidate
+    raise ValueError("Пустая маска дней недели.")
+
+
+def parse_reps_count(reps: str):
+    """
+    Достает число повторений из текстового поля, например "10" или "8-10".
+    :return: Первое число в строке или 0
+    """
+    match = re.match(r"\s*(\d+)", str(reps or ""))
+    return int(match.group(1)) if match else 0
+
+
+def max_reps_number(reps: str):
+    """
+    :return: Наибольшее число в текстовом поле повторений ("8-12" -> 12) или 0
+    """
+    return max(map(int, re.findall(r"\d+", str(reps or ""))), default=0)
+
+
+def estimate_one_rep_max(weight: float, reps: int):
+    """
+    Оценивает разовый максимум (1ПМ) по формуле Эпли.
+    :return: Расчетный 1ПМ в кг
+    """
+    if reps <= 0:
+        return 0.0
+    if reps == 1:
+        return float(weight)
+    return weight * (1 + reps / 30)
+
+
+def to_epoch_day(value):
+    """
+    :param value: date или строка 'YYYY-MM-DD'
+    :return: Номер дня от 1970-01-01
+    """
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+@lru_cache(maxsize=4096)
+def from_epoch_day(value: int):
+    """
+    :return: Строка 'YYYY-MM-DD'
+    """
+    return date.fromordinal(value + _EPOCH_ORDINAL).isoformat()
+
+
+def encode_weight(weight: float):
+    """
+    Переводит вес в целое число сотых долей кг (фиксированная точка).
+    """
+    if weight is None:
+        return None
+    if not math.isfinite(weight):
+        raise ValueError(f"Недопустимый вес: {weight}")
+    return round(weight * WEIGHT_SCALE)
+
+
+def decode_weight(value: int):
+    return None if value is None else value / WEIGHT_SCALE
+
+
+def encode_reps(reps: str):
+    """
+    Раскладывает текстовое поле повторений на целые числа: "10" -> (10, None, None), "8-12" -> (8, 12, None).
+    Текст, который не восстанавливается из чисел в точности (" 10", "до отказа"), сохраняется как есть.
+    :return: Кортеж (число_повторений для расчетов, верхняя_граница_диапазона, исходный_текст)
+    """
+    text = "" if reps is None else str(reps)
+    match = _reps_re.fullmatch(text)
+    if match:
+        encoded = (int(match.group(1)), int(match.group(2)) if match.group(2) else None, None)
+        if decode_reps(*encoded) == text:
+            return encoded
+    return parse_reps_count(text), None, text
+
+
+def decode_reps(reps: int, reps_max: int, reps_text: str):
+    """
+    Обратное преобразование к encode_reps.
+    :return: Исходная строка повторений
+    """
+    if reps_text is not None:
+        return reps_text
+    return f"{reps}-{reps_max}" if reps_max is not None else str(reps)